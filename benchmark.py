@@ -0,0 +1,301 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Banco de pruebas de rendimiento. Genera rutas GPX sintéticas (de 1.000 a 10.000.000 de puntos)
+# y mide por separado el tiempo y el pico de memoria de cada etapa del análisis, para cada motor.
+#   python benchmark.py                                   # 1k, 10k, 100k y 1M puntos, todos los motores
+#   python benchmark.py --puntos 1000 10000000 --motores numpy --salida resultados.json
+#   python benchmark.py --formato csv --salida resultados.csv --sin-memoria
+# Los resultados (JSON o CSV) van a --salida o a la salida estándar; el resumen legible, a stderr.
+# La memoria se mide en una ejecución aparte con tracemalloc, para que no altere los tiempos.
+
+import argparse
+import csv
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import main as programa
+
+PUNTOS_POR_DEFECTO = [1_000, 10_000, 100_000, 1_000_000]
+PUNTOS_MAXIMOS = 10_000_000
+PARAMETROS = tuple(programa.VALORES_POR_DEFECTO[nombre] for nombre in programa.PARAMETROS)
+CAMPOS = ['puntos', 'motor', 'etapa', 'segundos', 'pico_memoria_bytes', 'entrada', 'salida']
+
+_GPX_CABECERA = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<gpx version="1.1" creator="AutoCalculadorDeTramos benchmark" '
+                 'xmlns="http://www.topografix.com/GPX/1/1">\n'
+                 '<metadata><name>Ruta sintética</name></metadata>\n')
+
+
+# --- Rutas sintéticas --------------------------------------------------------
+
+def generar_gpx(ruta, puntos, segmentos=3, faltan_elevaciones=0.01, semilla=0):
+    # Ruta a pie de `puntos` puntos repartidos en `segmentos` trkseg: pasos de unos 5 m con rumbo
+    # que cambia poco a poco, un relieve suave de varias ondas con ruido de GPS en la altura,
+    # puntos repetidos (distancia 0) y una fracción de puntos sin elevación.
+    azar = random.Random(semilla)
+    lat, lon, rumbo, recorrido = 40.4, -3.7, 0.0, 0.0
+    ondas = [(azar.uniform(300, 600), azar.uniform(1500, 8000), azar.uniform(0, 2 * math.pi)),
+             (azar.uniform(30, 80), azar.uniform(300, 900), azar.uniform(0, 2 * math.pi)),
+             (azar.uniform(2, 6), azar.uniform(40, 120), azar.uniform(0, 2 * math.pi))]
+    por_segmento = [puntos // segmentos + (1 if i < puntos % segmentos else 0) for i in range(segmentos)]
+
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write(_GPX_CABECERA)
+        f.write('<trk><name>Ruta sintética</name>\n')
+        for n in por_segmento:
+            f.write('<trkseg>\n')
+            bloque = []
+            for _ in range(n):
+                if azar.random() > 0.02:  # El resto son puntos repetidos, como en un GPS parado
+                    rumbo += azar.gauss(0, 0.15)
+                    paso = max(azar.gauss(5, 1.5), 0.5)
+                    recorrido += paso
+                    lat += paso * math.cos(rumbo) / 111_320
+                    lon += paso * math.sin(rumbo) / (111_320 * math.cos(math.radians(lat)))
+
+                if azar.random() < faltan_elevaciones:
+                    bloque.append(f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"></trkpt>\n')
+                else:
+                    altura = 900 + sum(a * math.sin(recorrido / l + fase) for a, l, fase in ondas) + azar.gauss(0, 0.3)
+                    bloque.append(f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{altura:.1f}</ele></trkpt>\n')
+                if len(bloque) >= 10_000:
+                    f.write(''.join(bloque))
+                    bloque.clear()
+            f.write(''.join(bloque))
+            f.write('</trkseg>\n')
+            # Salto entre segmentos, como al apagar y encender el GPS
+            lat += azar.uniform(-0.001, 0.001)
+            lon += azar.uniform(-0.001, 0.001)
+        f.write('</trk>\n</gpx>\n')
+
+
+def ruta_sintetica(carpeta, puntos, semilla=0):
+    # Reutiliza la ruta si ya se generó en la carpeta
+    ruta = os.path.join(carpeta, f"sintetica_{puntos}_{semilla}.gpx")
+    if not os.path.exists(ruta):
+        generar_gpx(ruta + '.tmp', puntos, semilla=semilla)
+        os.replace(ruta + '.tmp', ruta)
+    return ruta
+
+
+# --- Medición ----------------------------------------------------------------
+
+def medir(funcion, entrada, repeticiones=1, memoria=True, copiar=False):
+    # Devuelve (resultado, mejor tiempo en segundos, pico de memoria en bytes o None).
+    # copiar: la etapa modifica los tramos de entrada, así que cada ejecución recibe una copia
+    preparar = (lambda: [t.copy() for t in entrada]) if copiar else (lambda: entrada)
+
+    mejor = math.inf
+    for _ in range(repeticiones):
+        argumento = preparar()
+        gc.collect()
+        inicio = time.perf_counter()
+        resultado = funcion(argumento)
+        mejor = min(mejor, time.perf_counter() - inicio)
+
+    pico = None
+    if memoria:
+        argumento = preparar()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            funcion(argumento)
+            pico = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return resultado, mejor, pico
+
+
+def _longitud(valor):
+    if isinstance(valor, tuple):  # Columnas (distancias, elevaciones) del motor numpy
+        return len(valor[0])
+    return len(valor)
+
+
+def _columnas(funcion):
+    return lambda columnas: funcion(*columnas)
+
+
+def _a_tramos(columnas):
+    distancias, elevaciones = columnas
+    return [programa.Tramo(d, e) for d, e in zip(distancias.tolist(), elevaciones.tolist())]
+
+
+def etapas(ruta_gpx, motor, carpeta, excel=False):
+    # Lista de (nombre, función, modifica la entrada): cada función recibe la salida de la anterior
+    umbral, pendiente, minimo, horizontal, elevacion = PARAMETROS
+    plantilla = programa.resource_path('plantilla.xlsx')
+
+    if motor == 'stream':
+        comunes = [('iterar_tramos_finales', lambda _: list(programa.iterar_tramos_finales(ruta_gpx, *PARAMETROS)), False)]
+    elif motor == 'numpy':
+        comunes = [
+            ('calcular_pendientes_np', lambda _: programa.calcular_pendientes_np(ruta_gpx), False),
+            ('agrupar_por_direccion_np', _columnas(programa.agrupar_por_direccion_np), False),
+            ('agrupar_por_umbral_np', _columnas(lambda d, e: programa.agrupar_por_umbral_np(d, e, umbral)), False),
+            ('agrupar_por_direccion_np_2', _columnas(programa.agrupar_por_direccion_np), False),
+            ('agrupar_por_umbral2_np', _columnas(
+                lambda d, e: programa.agrupar_por_umbral2_np(d, e, pendiente, minimo, horizontal, elevacion)), False),
+            ('agrupar_por_direccion_np_3', _columnas(programa.agrupar_por_direccion_np), False),
+            ('a_tramos', _a_tramos, False),
+        ]
+    else:
+        # calcular_pendientes = leer_puntos_gpx + generar_pendientes, medidas por separado
+        comunes = [
+            ('leer_puntos_gpx', lambda _: list(programa.leer_puntos_gpx(ruta_gpx)), False),
+            ('generar_pendientes', lambda puntos: list(programa.generar_pendientes(puntos)), False),
+            ('agrupar_por_direccion', programa.agrupar_por_direccion, False),
+            ('agrupar_por_umbral', lambda t: programa.agrupar_por_umbral(t, umbral), False),
+            ('agrupar_por_direccion_2', programa.agrupar_por_direccion, False),
+            ('agrupar_por_umbral2', lambda t: programa.agrupar_por_umbral2(t, pendiente, minimo, horizontal, elevacion), False),
+            ('agrupar_por_direccion_3', programa.agrupar_por_direccion, False),
+        ]
+
+    finales = []
+    if motor != 'stream':
+        finales = [
+            ('primer_tramo', lambda t: list(programa.etapa_primer_tramo(t, umbral, minimo)), True),
+            ('calcular_pendiente_y_enumerar', programa.calcular_pendiente_y_enumerar, True),
+        ]
+
+    salida = os.path.join(carpeta, f"benchmark_{motor}.xlsx")
+
+    def escribir_xlsx(tramos):
+        import escritor_xlsx
+        escritor_xlsx.generar_calculador(plantilla, salida, [(None, tramos)], "Scout", "Media", 10, 60)
+        return tramos
+
+    def rellenar_con_excel(tramos):
+        # Incluye abrir y cerrar Excel, que es parte del coste real de este escritor
+        import xlwings as xw
+        app = xw.App(visible=False)
+        try:
+            wb = app.books.open(plantilla)
+            programa.rellenar_plantilla(wb.sheets[0], tramos, "Scout", "Media", 10, 60)
+            wb.close()
+        finally:
+            app.quit()
+        return tramos
+
+    escritura = [('escribir_xlsx', escribir_xlsx, False)]
+    if excel:
+        escritura.append(('rellenar_plantilla', rellenar_con_excel, False))
+    return comunes + finales + escritura
+
+
+def medir_ruta(ruta_gpx, puntos, motor, carpeta, repeticiones=1, memoria=True, excel=False):
+    resultados = []
+    valor = None
+    for nombre, funcion, copiar in etapas(ruta_gpx, motor, carpeta, excel):
+        entrada = None if valor is None else _longitud(valor)
+        valor, segundos, pico = medir(funcion, valor, repeticiones, memoria, copiar)
+        resultados.append({
+            'puntos': puntos,
+            'motor': motor,
+            'etapa': nombre,
+            'segundos': round(segundos, 6),
+            'pico_memoria_bytes': pico,
+            'entrada': entrada,
+            'salida': _longitud(valor),
+        })
+    return resultados
+
+
+def entorno():
+    datos = {
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'implementacion': platform.python_implementation(),
+        'sistema': platform.platform(),
+        'procesador': platform.processor() or platform.machine(),
+        'parametros': dict(zip(programa.PARAMETROS, PARAMETROS)),
+    }
+    try:
+        import numpy
+        datos['numpy'] = numpy.__version__
+    except ImportError:
+        datos['numpy'] = None
+    return datos
+
+
+def _resumen(resultados, salida):
+    for r in resultados:
+        pico = '-' if r['pico_memoria_bytes'] is None else f"{r['pico_memoria_bytes'] / 2**20:9.1f} MB"
+        print(f"{r['puntos']:>10} {r['motor']:<7} {r['etapa']:<30} {r['segundos']:10.4f} s {pico:>12} "
+              f"{r['entrada'] if r['entrada'] is not None else '-':>9} -> {r['salida']}", file=salida)
+
+
+def ejecutar(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el rendimiento de cada etapa del análisis con rutas sintéticas.")
+    parser.add_argument('--puntos', type=int, nargs='+', default=PUNTOS_POR_DEFECTO,
+                        help=f"tamaños de ruta, hasta {PUNTOS_MAXIMOS} (por defecto: %(default)s)")
+    parser.add_argument('--motores', nargs='+', choices=list(programa.MOTORES), default=list(programa.MOTORES))
+    parser.add_argument('--repeticiones', type=int, default=1, help="se guarda el mejor tiempo (por defecto: %(default)s)")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--carpeta', help="carpeta para las rutas generadas; se reutilizan entre ejecuciones "
+                                          "(por defecto, una temporal)")
+    parser.add_argument('--sin-memoria', action='store_true', help="no medir el pico de memoria")
+    parser.add_argument('--excel', action='store_true', help="medir también rellenar_plantilla con Excel (xlwings)")
+    parser.add_argument('--formato', choices=['json', 'csv'], default='json')
+    parser.add_argument('--salida', help="archivo de resultados (por defecto, la salida estándar)")
+    args = parser.parse_args(argv)
+
+    if any(n < 2 or n > PUNTOS_MAXIMOS for n in args.puntos):
+        parser.error(f"--puntos debe estar entre 2 y {PUNTOS_MAXIMOS}")
+
+    with tempfile.TemporaryDirectory() as temporal:
+        carpeta = args.carpeta or temporal
+        os.makedirs(carpeta, exist_ok=True)
+        resultados = []
+        for puntos in args.puntos:
+            ruta_gpx = ruta_sintetica(carpeta, puntos, args.semilla)
+            for motor in args.motores:
+                medidas = medir_ruta(ruta_gpx, puntos, motor, carpeta, args.repeticiones,
+                                     not args.sin_memoria, args.excel)
+                _resumen(medidas, sys.stderr)
+                resultados.extend(medidas)
+
+    salida = open(args.salida, 'w', encoding='utf-8', newline='') if args.salida else sys.stdout
+    try:
+        if args.formato == 'json':
+            json.dump({'entorno': entorno(), 'resultados': resultados}, salida, ensure_ascii=False, indent=2)
+            salida.write('\n')
+        else:
+            escritor = csv.DictWriter(salida, fieldnames=CAMPOS, lineterminator='\n')
+            escritor.writeheader()
+            escritor.writerows(resultados)
+    finally:
+        if args.salida:
+            salida.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(ejecutar())
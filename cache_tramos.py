@@ -0,0 +1,164 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Caché en disco de los análisis, direccionada por el contenido de cada GPX:
+#   segmentos/<huella>.bin            distancias y elevaciones de calcular_pendientes
+#   tramos/<huella>-<parametros>.json tramos finales para unos valores de expertos concretos
+# Si el archivo cambia, cambia su huella y las entradas antiguas dejan de usarse hasta que
+# las elimina el recorte por tamaño (se borran primero las menos usadas).
+
+import hashlib
+import json
+import os
+import struct
+from array import array
+
+from entradas import MiembroZip, firma
+from escritura_atomica import escribir_atomico
+
+# Subir si cambia el algoritmo, para no reutilizar resultados antiguos
+VERSION = 1
+
+_CABECERA = struct.Struct('<4sQ')
+_MAGIC = b'GXS1'
+
+
+def huella_archivo(ruta):
+    # Hash del contenido del archivo (de un miembro de un zip, el de su contenido descomprimido)
+    h = hashlib.blake2b(digest_size=20)
+    with (ruta.abrir() if isinstance(ruta, MiembroZip) else open(ruta, 'rb')) as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def carpeta_por_defecto():
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'AutoCalculadorDeTramos')
+
+
+class CacheTramos:
+    def __init__(self, carpeta=None, tamano_maximo=256 * 1024 * 1024):
+        self.carpeta = carpeta or carpeta_por_defecto()
+        self.tamano_maximo = tamano_maximo
+        self._tamano = None
+
+    def _ruta(self, *partes):
+        return os.path.join(self.carpeta, *partes)
+
+    def huella(self, ruta):
+        # Hash del contenido. Para no leer el archivo entero en cada ejecución se recuerda el hash
+        # de cada (ruta, tamaño, fecha de modificación); si el archivo cambia, se vuelve a calcular.
+        # De un miembro de un zip se usan su tamaño y su CRC (entradas.firma).
+        clave = "|".join(map(str, [os.path.abspath(str(ruta)), *firma(ruta)]))
+        memo = self._ruta('huellas', hashlib.sha1(clave.encode('utf-8')).hexdigest())
+        try:
+            with open(memo, 'r') as f:
+                return f.read()
+        except OSError:
+            pass
+
+        huella = huella_archivo(ruta)
+        self._escribir(memo, huella.encode('ascii'))
+        return huella
+
+    def leer_segmentos(self, huella):
+        datos = self._leer(self._ruta('segmentos', f"{huella}.bin"))
+        if datos is None:
+            return None
+        magic, n = _CABECERA.unpack_from(datos)
+        if magic != _MAGIC:
+            return None
+        inicio = _CABECERA.size
+        distancias, elevaciones = array('d'), array('d')
+        distancias.frombytes(datos[inicio:inicio + 8 * n])
+        elevaciones.frombytes(datos[inicio + 8 * n:inicio + 16 * n])
+        return distancias, elevaciones
+
+    def guardar_segmentos(self, huella, distancias, elevaciones):
+        # Admite array('d') o arrays de numpy: se guardan tal cual, como float64
+        datos = _CABECERA.pack(_MAGIC, len(distancias)) + bytes(memoryview(distancias)) + bytes(memoryview(elevaciones))
+        self._escribir(self._ruta('segmentos', f"{huella}.bin"), datos)
+
+    def _clave_tramos(self, huella, parametros):
+        texto = json.dumps([VERSION, *parametros])
+        return self._ruta('tramos', f"{huella}-{hashlib.sha1(texto.encode('utf-8')).hexdigest()[:16]}.json")
+
+    def leer_tramos(self, huella, parametros):
+        datos = self._leer(self._clave_tramos(huella, parametros))
+        return None if datos is None else json.loads(datos)
+
+    def guardar_tramos(self, huella, parametros, tramos_finales):
+        self._escribir(self._clave_tramos(huella, parametros), json.dumps([dict(tramo) for tramo in tramos_finales]).encode('utf-8'))
+
+    def _leer(self, ruta):
+        try:
+            with open(ruta, 'rb') as f:
+                datos = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(ruta)  # La fecha de modificación hace de "último uso" para el recorte
+        except OSError:
+            pass
+        return datos
+
+    def _escribir(self, ruta, datos):
+        # Escritura atómica: varios procesos pueden estar usando la misma caché
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with escribir_atomico(ruta) as f:
+            f.write(datos)
+
+        if self._tamano is None:
+            self._tamano = sum(tamano for _, tamano, _ in self._entradas())
+        else:
+            self._tamano += len(datos)
+        if self._tamano > self.tamano_maximo:
+            self.recortar()
+
+    def _entradas(self):
+        for subcarpeta in ('huellas', 'segmentos', 'tramos'):
+            try:
+                with os.scandir(self._ruta(subcarpeta)) as it:
+                    for entrada in it:
+                        if entrada.is_file() and not entrada.name.endswith('.tmp'):
+                            st = entrada.stat()
+                            yield entrada.path, st.st_size, st.st_mtime_ns
+            except FileNotFoundError:
+                pass
+
+    def recortar(self, tamano_objetivo=None):
+        # Borra las entradas usadas hace más tiempo hasta quedar por debajo del límite
+        if tamano_objetivo is None:
+            tamano_objetivo = int(self.tamano_maximo * 0.9)
+        entradas = sorted(self._entradas(), key=lambda e: e[2])
+        total = sum(tamano for _, tamano, _ in entradas)
+        for ruta, tamano, _ in entradas:
+            if total <= tamano_objetivo:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamano
+            except OSError:
+                pass
+        self._tamano = total
+
+    def vaciar(self):
+        self.recortar(0)
@@ -0,0 +1,283 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Línea de comandos, sin interfaz gráfica. Ejemplos:
+#   python cli.py ruta.gpx -o ruta.xlsx --escritor xlsx
+#   python cli.py carpeta/ --formato json
+#   python cli.py ruta.gpx --formato csv -o tramos.csv --motor numpy
+#   python cli.py carpeta/ --formato gxb
+# Con --formato json o csv solo se calculan los tramos: no se carga Excel ni la plantilla.
+#   python cli.py carpeta/ --incremental --vigilar 10
+# --incremental solo vuelve a analizar los GPX nuevos o modificados y solo cambia sus hojas del calculador;
+# --vigilar lo repite cada tantos segundos hasta que se pulsa Ctrl+C.
+# Con --formato gxb se convierten los GPX a puntos binarios (.gxb), que luego se abren sin leer el XML.
+#   python cli.py ruta.gpx --etapas 12.5 30
+#   python cli.py rutas.zip --formato json
+# Los GPX comprimidos (.gpx.gz, .gpx.bz2, .gpx.xz) y los zip se leen sin descomprimirlos a disco;
+# cada GPX de un zip es una ruta más, con su propia hoja.
+# --etapas corta la ruta en esos kilómetros y saca una hoja por etapa, leyendo el GPX una sola vez.
+#   python cli.py viaje.gpx --segmentos pista --procesos 0
+# --segmentos agrupa cada trk/trkseg por separado, sin el salto entre uno y otro: 'unir' saca una sola hoja,
+# 'pista' una por trk y 'segmento' una por trkseg. Con --procesos, los segmentos se reparten entre los núcleos.
+# --tiempos escribe en stderr lo que tarda en arrancar (importar el programa) y el total.
+# --informe guarda en JSON el tiempo y los tramos de cada etapa (--memoria añade el pico de memoria).
+
+import time
+
+_INICIO = time.perf_counter()
+
+import argparse
+import csv
+import json
+import os
+import pathlib
+import sys
+
+import entradas
+import main as programa
+from cache_tramos import CacheTramos
+from medidas import Medidas
+
+_TIEMPO_IMPORTACION = time.perf_counter() - _INICIO
+
+SECCIONES = ["Colonia", "Manada", "Scout", "Unidad Esculta", "Clan/Rovers"]
+PREPARACIONES = ["Muy baja", "Baja", "Media", "Alta", "Muy alta"]
+COLUMNAS_CSV = ['hoja', 'tramo', 'distancia_m', 'elevacion_m', 'pendiente_%']
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        prog='AutoCalculadorDeTramos',
+        description="Genera el calculador de tramos de un archivo GPX o de una carpeta de archivos GPX.")
+    parser.add_argument('entrada', help="archivo .gpx (también .gpx.gz, .gpx.bz2 o .gpx.xz), "
+                                        "zip con archivos .gpx o carpeta con archivos .gpx")
+    parser.add_argument('-o', '--salida',
+                        help="archivo de salida (por defecto, junto a la entrada; con json/csv, la salida estándar)")
+    parser.add_argument('--formato', choices=['xlsx', 'json', 'csv', 'gxb'], default='xlsx',
+                        help="xlsx: calculador de tramos; json/csv: solo los tramos; "
+                             "gxb: convierte los GPX a puntos binarios (por defecto: %(default)s)")
+
+    ruta = parser.add_argument_group("calculador")
+    ruta.add_argument('--seccion', choices=SECCIONES, default="Scout", help="(por defecto: %(default)s)")
+    ruta.add_argument('--preparacion', choices=PREPARACIONES, default="Media", help="(por defecto: %(default)s)")
+    ruta.add_argument('--descanso', type=int, default=10, help="minutos de descanso (por defecto: %(default)s)")
+    ruta.add_argument('--cada', type=int, default=60, help="cada cuántos minutos se descansa (por defecto: %(default)s)")
+    ruta.add_argument('--etapas', type=float, nargs='+', metavar='KM',
+                      help="con un archivo, kilómetros en los que se corta la ruta: una hoja por etapa")
+
+    expertos = parser.add_argument_group("valores para expertos")
+    por_defecto = programa.VALORES_POR_DEFECTO
+    expertos.add_argument('--longitud-minima-tramo', type=int, default=por_defecto['longitud_minima_tramo'],
+                          help="(por defecto: %(default)s)")
+    expertos.add_argument('--umbral-elevacion', type=int, default=por_defecto['umbral_elevacion'],
+                          help="(por defecto: %(default)s)")
+    expertos.add_argument('--pendiente-maxima-valida', type=float, default=por_defecto['pendiente_maxima_valida'],
+                          help="(por defecto: %(default)s)")
+    expertos.add_argument('--longitud-horizontal-minima', type=int, default=por_defecto['longitud_horizontal_minima'],
+                          help="(por defecto: %(default)s)")
+    expertos.add_argument('--elevacion-minima-asociada', type=int, default=por_defecto['elevacion_minima_asociada'],
+                          help="(por defecto: %(default)s)")
+    expertos.add_argument('--decimar', type=float, default=0, metavar='METROS',
+                          help="simplifica el perfil antes de agrupar, con esta tolerancia vertical (por defecto: sin simplificar)")
+    expertos.add_argument('--segmentos', choices=programa.POLITICAS_SEGMENTOS,
+                          help="agrupa cada pista/segmento del GPX por separado y los une en una hoja (unir) o saca "
+                               "una hoja por pista o por segmento (por defecto: todo el GPX como una sola ruta)")
+
+    ejecucion = parser.add_argument_group("ejecución")
+    ejecucion.add_argument('--escritor', choices=['excel', 'xlsx'], default='xlsx',
+                           help="excel: rellena la plantilla con Excel; xlsx: edita el archivo sin Excel (por defecto: %(default)s)")
+    ejecucion.add_argument('--motor', choices=list(programa.MOTORES), default='python', help="(por defecto: %(default)s)")
+    ejecucion.add_argument('--procesos', type=int, default=1,
+                           help="procesos para analizar una carpeta o, con --segmentos, los segmentos de un archivo; "
+                                "0 = todos los núcleos (por defecto: %(default)s)")
+    ejecucion.add_argument('--incremental', action='store_true',
+                           help="con una carpeta, actualiza solo las hojas de los GPX nuevos, modificados o eliminados")
+    ejecucion.add_argument('--vigilar', type=float, metavar='SEGUNDOS',
+                           help="con una carpeta, actualiza el calculador cada SEGUNDOS segundos (implica --incremental)")
+    ejecucion.add_argument('--sin-cache', action='store_true', help="no usar ni guardar la caché de análisis")
+    ejecucion.add_argument('--carpeta-cache', help="carpeta de la caché (por defecto, la del usuario)")
+    ejecucion.add_argument('--tiempos', action='store_true', help="escribe en stderr los tiempos de arranque y total")
+    ejecucion.add_argument('--informe', nargs='?', const='-', metavar='ARCHIVO',
+                           help="guarda en JSON las medidas de cada etapa (sin ARCHIVO, en stderr)")
+    ejecucion.add_argument('--memoria', action='store_true', help="incluye en el informe el pico de memoria de cada etapa")
+    return parser
+
+
+def _parametros(args):
+    return (args.umbral_elevacion, args.pendiente_maxima_valida, args.longitud_minima_tramo,
+            args.longitud_horizontal_minima, args.elevacion_minima_asociada)
+
+
+def _es_carpeta(entrada):
+    # Una carpeta o un zip de GPX: una hoja por ruta
+    path = pathlib.Path(entrada)
+    return path.is_dir() or (path.is_file() and entradas.es_zip(path))
+
+
+def _salida_por_defecto(entrada):
+    path = pathlib.Path(entrada)
+    if path.is_dir():
+        return str(path / "CalculadorDeTramos.xlsx")
+    return str(entradas.sin_compresion(path).with_suffix(".xlsx"))
+
+
+def _calcular_tramos(args, procesos, cache, medidas):
+    # Devuelve [(nombre de hoja, tramos)] y los (archivo, error) de la carpeta
+    path = pathlib.Path(args.entrada)
+    if args.etapas:
+        if _es_carpeta(path) or args.decimar or args.segmentos:
+            raise ValueError("--etapas necesita un archivo y no admite --decimar ni --segmentos")
+        return programa.tramos_por_etapas(path, args.etapas, *_parametros(args), motor=args.motor, cache=cache,
+                                          medidas=medidas), []
+    if _es_carpeta(path):
+        if args.segmentos not in (None, 'unir'):
+            raise ValueError("Con una carpeta, --segmentos solo admite 'unir'")
+        return programa.analizar_carpeta(path, *_parametros(args), motor=args.motor, procesos=procesos,
+                                         cache=cache, medidas=medidas, decimar=args.decimar,
+                                         segmentos=bool(args.segmentos))
+    if args.segmentos in ('pista', 'segmento'):
+        return programa.tramos_por_segmentos(path, *_parametros(args), politica=args.segmentos, motor=args.motor,
+                                             procesos=procesos, medidas=medidas, decimar=args.decimar), []
+    tramos = programa.get_tramos_finales(path, *_parametros(args), motor=args.motor, cache=cache, medidas=medidas,
+                                         decimar=args.decimar, segmentos=bool(args.segmentos), procesos=procesos)
+    return [(entradas.nombre_de_ruta(path), tramos)], []
+
+
+def escribir_json(hojas, errores, salida):
+    datos = {
+        'hojas': [{'nombre': nombre, 'tramos': [dict(tramo) for tramo in tramos]} for nombre, tramos in hojas],
+        'errores': [{'archivo': archivo, 'error': error} for archivo, error in errores],
+    }
+    json.dump(datos, salida, ensure_ascii=False, indent=2)
+    salida.write('\n')
+
+
+def escribir_csv(hojas, salida):
+    escritor = csv.DictWriter(salida, fieldnames=COLUMNAS_CSV, extrasaction='ignore', lineterminator='\n')
+    escritor.writeheader()
+    for nombre, tramos in hojas:
+        for tramo in tramos:
+            escritor.writerow({'hoja': nombre, **tramo})
+
+
+def _escribir(formato, hojas, errores, salida):
+    if formato == 'json':
+        escribir_json(hojas, errores, salida)
+    else:
+        escribir_csv(hojas, salida)
+
+
+def _escribir_informe(medidas, destino):
+    if destino == '-':
+        json.dump(medidas.informe(), sys.stderr, ensure_ascii=False, indent=2)
+        sys.stderr.write('\n')
+        return
+    with open(destino, 'w', encoding='utf-8') as f:
+        json.dump(medidas.informe(), f, ensure_ascii=False, indent=2)
+
+
+def _mostrar_actualizacion(resumen, errores):
+    if resumen is not None:
+        hora = time.strftime('%H:%M:%S')
+        if resumen['completo']:
+            print(f"[{hora}] Calculador generado con {len(resumen['anadidas'])} hojas", file=sys.stderr)
+        else:
+            for clave, titulo in (('anadidas', 'añadidas'), ('reescritas', 'reescritas'), ('quitadas', 'quitadas')):
+                if resumen[clave]:
+                    print(f"[{hora}] Hojas {titulo}: {', '.join(resumen[clave])}", file=sys.stderr)
+    for archivo, error in errores:
+        print(f"No se ha podido procesar {archivo}: {error}", file=sys.stderr)
+
+
+def _vigilar(args, procesos, cache, cada):
+    salida = args.salida or _salida_por_defecto(args.entrada)
+    print(f"Vigilando {args.entrada} (Ctrl+C para terminar)", file=sys.stderr)
+    try:
+        programa.vigilar_carpeta(args.entrada, salida, *_parametros(args),
+                                 args.seccion, args.preparacion, args.descanso, cada,
+                                 intervalo=args.vigilar, al_actualizar=_mostrar_actualizacion,
+                                 escritor=args.escritor, motor=args.motor, procesos=procesos, cache=cache,
+                                 decimar=args.decimar, segmentos=bool(args.segmentos))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def ejecutar(argv=None):
+    args = crear_parser().parse_args(argv)
+    inicio = time.perf_counter()
+
+    if not os.path.exists(args.entrada):
+        print(f"Error: no existe '{args.entrada}'", file=sys.stderr)
+        return 2
+    procesos = args.procesos or None
+    cache = None if args.sin_cache else CacheTramos(args.carpeta_cache)
+    cada = max(args.cada, 1)
+    medidas = Medidas(args.memoria) if args.informe else None
+
+    try:
+        if args.formato == 'gxb':
+            if _es_carpeta(args.entrada):
+                convertidos = programa.convertir_carpeta(args.entrada)
+            else:
+                convertidos = [programa.convertir_gpx(args.entrada, args.salida)]
+            for ruta in convertidos:
+                print(ruta)
+            errores = []
+        elif args.vigilar:
+            if args.formato != 'xlsx' or not _es_carpeta(args.entrada):
+                raise ValueError("--vigilar necesita una carpeta y el formato xlsx")
+            if args.segmentos not in (None, 'unir'):
+                raise ValueError("Con una carpeta, --segmentos solo admite 'unir'")
+            return _vigilar(args, procesos, cache, cada)
+        elif args.formato == 'xlsx':
+            salida = args.salida or _salida_por_defecto(args.entrada)
+            errores = programa.main(args.entrada, salida, *_parametros(args),
+                                    args.seccion, args.preparacion, args.descanso, cada,
+                                    escritor=args.escritor, motor=args.motor, procesos=procesos, cache=cache,
+                                    medidas=medidas, decimar=args.decimar, incremental=args.incremental,
+                                    etapas=args.etapas, segmentos=args.segmentos)
+        else:
+            hojas, errores = _calcular_tramos(args, procesos, cache, medidas)
+            if errores and not hojas:
+                raise ValueError("No se ha podido procesar ningún archivo GPX")
+            if args.salida:
+                with open(args.salida, 'w', encoding='utf-8', newline='') as f:
+                    _escribir(args.formato, hojas, errores, f)
+            else:
+                _escribir(args.formato, hojas, errores, sys.stdout)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    for archivo, error in errores:
+        print(f"No se ha podido procesar {archivo}: {error}", file=sys.stderr)
+    if medidas is not None:
+        _escribir_informe(medidas, args.informe)
+    if args.tiempos:
+        print(f"arranque: {_TIEMPO_IMPORTACION * 1000:.1f} ms, "
+              f"total: {(time.perf_counter() - _INICIO) * 1000:.1f} ms "
+              f"(análisis y escritura: {(time.perf_counter() - inicio) * 1000:.1f} ms)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    programa.multiprocessing.freeze_support()
+    sys.exit(ejecutar())
@@ -0,0 +1,209 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Rutas comprimidas y archivos zip de rutas, leídos sin descomprimirlos a disco:
+#   ruta.gpx.gz, ruta.gpx.bz2, ruta.gpx.xz: un GPX comprimido, que se trata como el GPX
+#   rutas.zip: cada .gpx de dentro es una ruta más (MiembroZip), con su propia hoja
+# abrir() (siempre con with) da un archivo binario que se descomprime según se lee, y es lo que recibe
+# el lector de GPX. Un MiembroZip se puede pasar a otros procesos: cada uno abre el zip por su cuenta.
+# RutaEnMemoria es lo mismo para un archivo que solo está en memoria (los que recibe servidor.py); con
+# limite, leer más de esos bytes descomprimidos da ValueError, para que un archivo pequeño muy comprimido
+# no pase por encima del tamaño máximo de una petición.
+
+import bz2
+import contextlib
+import gzip
+import io
+import lzma
+import os
+import pathlib
+import zipfile
+
+COMPRESIONES = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+EXTENSION_ZIP = '.zip'
+# Las que se admiten como entrada, además de .gxb
+EXTENSIONES = ('.gpx', *(f'.gpx{sufijo}' for sufijo in COMPRESIONES), EXTENSION_ZIP)
+
+
+class MiembroZip:
+    __slots__ = ('zip', 'miembro')
+
+    def __init__(self, zip, miembro):
+        self.zip = pathlib.Path(zip)
+        self.miembro = miembro
+
+    @property
+    def name(self):
+        # Único dentro de la carpeta: 'rutas.zip/etapa1.gpx'
+        return f"{self.zip.name}/{self.miembro}"
+
+    @property
+    def stem(self):
+        return pathlib.PurePosixPath(self.miembro).stem
+
+    @property
+    def suffix(self):
+        return pathlib.PurePosixPath(self.miembro).suffix
+
+    @contextlib.contextmanager
+    def abrir(self):
+        with zipfile.ZipFile(self.zip) as archivo, archivo.open(self.miembro) as miembro:
+            yield miembro
+
+    def firma(self):
+        # Tamaño y CRC del miembro: cambia con su contenido, no con el de los demás miembros del zip
+        with zipfile.ZipFile(self.zip) as archivo:
+            info = archivo.getinfo(self.miembro)
+        return [info.file_size, info.CRC]
+
+    def __eq__(self, otro):
+        if isinstance(otro, MiembroZip):
+            return (self.zip, self.miembro) == (otro.zip, otro.miembro)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.zip, self.miembro))
+
+    def __str__(self):
+        return os.path.join(os.fspath(self.zip), self.miembro)
+
+    def __repr__(self):
+        return f"MiembroZip({os.fspath(self.zip)!r}, {self.miembro!r})"
+
+
+class _Limitado(io.RawIOBase):
+    # Lee de otro archivo y da ValueError en cuanto se pasa de `limite` bytes
+    def __init__(self, archivo, limite, nombre):
+        self._archivo = archivo
+        self._limite = limite
+        self._restante = limite
+        self._nombre = nombre
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        datos = self._archivo.read(min(len(destino), self._restante + 1))
+        if len(datos) > self._restante:
+            raise ValueError(f"'{self._nombre}' descomprimido supera el tamaño máximo ({self._limite} bytes)")
+        self._restante -= len(datos)
+        destino[:len(datos)] = datos
+        return len(datos)
+
+    def close(self):
+        if not self.closed:
+            self._archivo.close()
+        super().close()
+
+
+class RutaEnMemoria:
+    # Un archivo que no está en disco (por ejemplo, uno subido al servidor): nombre y contenido,
+    # comprimido o no según la extensión del nombre. limite: bytes que puede ocupar descomprimido (None = sin límite)
+    __slots__ = ('name', 'datos', 'limite')
+
+    def __init__(self, name, datos, limite=None):
+        self.name = name
+        self.datos = datos
+        self.limite = limite
+
+    @property
+    def stem(self):
+        return nombre_de_ruta(self.name)
+
+    def abrir(self):
+        archivo = io.BytesIO(self.datos)
+        abrir_comprimido = COMPRESIONES.get(compresion(self.name))
+        if abrir_comprimido is None:
+            return archivo
+        archivo = abrir_comprimido(archivo, 'rb')
+        if self.limite is None:
+            return archivo
+        return io.BufferedReader(_Limitado(archivo, self.limite, self.name))
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"RutaEnMemoria({self.name!r}, <{len(self.datos)} bytes>)"
+
+
+def compresion(ruta):
+    # La extensión de compresión de la ruta ('.gz', '.bz2', '.xz') o None
+    if isinstance(ruta, MiembroZip):
+        return None
+    if isinstance(ruta, RutaEnMemoria):
+        ruta = ruta.name
+    sufijo = os.path.splitext(os.fspath(ruta))[1].lower()
+    return sufijo if sufijo in COMPRESIONES else None
+
+
+def es_zip(ruta):
+    return str(ruta).lower().endswith(EXTENSION_ZIP) and not isinstance(ruta, MiembroZip)
+
+
+def sin_compresion(ruta):
+    # 'ruta.gpx.gz' -> 'ruta.gpx'; el resto, igual
+    ruta = pathlib.Path(ruta)
+    return ruta.with_suffix('') if compresion(ruta) else ruta
+
+
+def nombre_de_ruta(ruta):
+    # El nombre de la ruta, sin carpeta, zip, extensión ni compresión: 'rutas.zip/Etapa 1.gpx' -> 'Etapa 1'
+    if isinstance(ruta, (MiembroZip, RutaEnMemoria)):
+        return ruta.stem
+    return pathlib.PurePosixPath(sin_compresion(ruta).as_posix()).stem
+
+
+def es_gpx(ruta):
+    # .gpx, comprimido o no
+    if isinstance(ruta, MiembroZip):
+        return ruta.suffix.lower() == '.gpx'
+    if isinstance(ruta, RutaEnMemoria):
+        ruta = ruta.name
+    return sin_compresion(ruta).suffix.lower() == '.gpx'
+
+
+def abrir(ruta):
+    # Archivo binario con el contenido de la ruta, descomprimido según se lee
+    if isinstance(ruta, (MiembroZip, RutaEnMemoria)):
+        return ruta.abrir()
+    if es_zip(ruta):
+        # Solo llega aquí un zip que no se ha podido listar (listar_gpx lo deja para informar del error)
+        raise ValueError(f"'{os.path.basename(ruta)}' no es un archivo zip válido")
+    abrir_comprimido = COMPRESIONES.get(compresion(ruta))
+    if abrir_comprimido is not None:
+        return abrir_comprimido(ruta, 'rb')
+    return open(ruta, 'rb')
+
+
+def firma(ruta):
+    # Lo que cambia cuando cambia el archivo, sin leerlo entero: tamaño y fecha (o tamaño y CRC en un zip)
+    if isinstance(ruta, MiembroZip):
+        return ruta.firma()
+    st = os.stat(ruta)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def listar_zip(ruta):
+    # Los GPX del zip, en el orden en que están guardados
+    with zipfile.ZipFile(ruta) as archivo:
+        return [MiembroZip(ruta, info.filename) for info in archivo.infolist()
+                if not info.is_dir() and info.filename.lower().endswith('.gpx')
+                and not pathlib.PurePosixPath(info.filename).name.startswith('.')]
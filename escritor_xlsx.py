@@ -0,0 +1,480 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Rellena plantilla.xlsx editando directamente el paquete xlsx (zip + XML), sin Excel.
+# Hace lo mismo que rellenar_plantilla con xlwings: escribe C4/E4/C6/E6, inserta las filas
+# que falten desde la 21 de una sola vez y copia las fórmulas de la fila 20 en las nuevas.
+# La hoja de la plantilla se analiza una sola vez (Plantilla): cada hoja nueva se arma con sus filas
+# ya separadas y solo se calculan las referencias que mueven las filas insertadas, así que el tiempo
+# crece con las celdas escritas y no con el tamaño de la plantilla por el número de hojas.
+
+import os
+import re
+import zipfile
+from xml.sax.saxutils import escape, unescape
+
+from escritura_atomica import escribir_atomico
+
+FILA_INICIAL = 12
+FILA_MODELO = 20
+FILA_INSERCION = 21
+FILAS_EN_PLANTILLA = 10
+
+_TIPO_HOJA = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+_REL_HOJA = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet'
+_REL_CALCCHAIN = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/calcChain'
+
+# Literal de texto | referencia a otra hoja (no se toca) | referencia de celda
+_RE_REFERENCIA = re.compile(
+    r'''("(?:[^"]|"")*")'''
+    r'''|((?:'(?:[^']|'')+'|[A-Za-z_][\w.]*)!\$?[A-Z]{1,3}\$?\d+(?::\$?[A-Z]{1,3}\$?\d+)?)'''
+    r'''|(?<![\w.$])(\$?)([A-Z]{1,3})(\$?)(\d+)(?![\w(!])'''
+)
+# Zonas del XML de una hoja que contienen números de fila o referencias
+_RE_ZONAS = re.compile(
+    r'(<row r=")(\d+)(")'
+    r'|(\s(?:r|ref|sqref)=")([^"]*)(")'
+    r'|(<(f|formula|xm:f|xm:sqref)\b[^>]*>)([^<]*)(</\8>)'
+)
+_RE_FILA = re.compile(r'<row r="(\d+)"[^>]*?(?:/>|>.*?</row>)', re.S)
+_RE_CELDA = re.compile(r'<c r="([A-Z]+)\d+"([^>]*?)(?:/>|>.*?</c>)', re.S)
+_RE_ATRIBUTO_REF = re.compile(r'(\s(?:r|ref|sqref)=")([^"]*)(")')
+_RE_FORMULA = re.compile(r'<f\b([^>]*?)(?:/>|>([^<]*)</f>)')
+_RE_VALOR_CACHEADO = re.compile(r'(<f\b[^>]*?(?:/>|>[^<]*</f>))<v>[^<]*</v>')
+
+_CARACTERES_NO_VALIDOS = re.compile(r'[\[\]:*?/\\]')
+
+
+def _mover_referencias(texto, nueva_fila):
+    def sustituir(m):
+        if m.group(1) or m.group(2):
+            return m.group(0)
+        abs_col, col, abs_fila, fila = m.group(3, 4, 5, 6)
+        return f"{abs_col}{col}{abs_fila}{nueva_fila(int(fila), bool(abs_fila))}"
+    return _RE_REFERENCIA.sub(sustituir, texto)
+
+
+def _sustituir_filas(xml, nueva_fila):
+    # Cambia cada número de fila del XML de una hoja (filas, celdas, rangos y referencias de las
+    # fórmulas) por nueva_fila(fila, absoluta)
+    def sustituir(m):
+        if m.group(1):
+            return f"{m.group(1)}{nueva_fila(int(m.group(2)), False)}{m.group(3)}"
+        if m.group(4):
+            return m.group(4) + _mover_referencias(m.group(5), nueva_fila) + m.group(6)
+        # El rango de una fórmula compartida (ref="F12:F21") también crece con la inserción
+        etiqueta = _RE_ATRIBUTO_REF.sub(lambda a: a.group(1) + _mover_referencias(a.group(2), nueva_fila) + a.group(3),
+                                        m.group(7))
+        return etiqueta + _mover_referencias(m.group(9), nueva_fila) + m.group(10)
+    return _RE_ZONAS.sub(sustituir, xml)
+
+
+def _celda(ref, estilo, valor):
+    if valor is None:
+        return f'<c r="{ref}"{estilo}/>'
+    if isinstance(valor, str):
+        return f'<c r="{ref}"{estilo} t="inlineStr"><is><t>{escape(valor)}</t></is></c>'
+    return f'<c r="{ref}"{estilo}><v>{valor!r}</v></c>'
+
+
+def _columna_a_numero(columna):
+    numero = 0
+    for letra in columna:
+        numero = numero * 26 + ord(letra) - 64
+    return numero
+
+
+def _poner_valor(filas, columna, fila, valor):
+    ref = f"{columna}{fila}"
+    fila_xml = filas.get(fila)
+    if fila_xml is None:
+        filas[fila] = f'<row r="{fila}">{_celda(ref, "", valor)}</row>'
+        return
+    if fila_xml.endswith('/>'):
+        fila_xml = fila_xml[:-2] + '></row>'
+
+    # Las celdas de una fila tienen que ir en orden de columna
+    posicion = fila_xml.index('</row>')
+    for m in _RE_CELDA.finditer(fila_xml):
+        if m.group(1) == columna:
+            estilo = re.search(r'\ss="\d+"', m.group(2))
+            nueva = _celda(ref, estilo.group(0) if estilo else '', valor)
+            filas[fila] = fila_xml[:m.start()] + nueva + fila_xml[m.end():]
+            return
+        if _columna_a_numero(m.group(1)) > _columna_a_numero(columna):
+            posicion = m.start()
+            break
+    filas[fila] = fila_xml[:posicion] + _celda(ref, '', valor) + fila_xml[posicion:]
+
+
+class _Molde:
+    # Un trozo de XML con algunos números de fila sin resolver. Cada uno se mueve n filas si está en
+    # FILA_INSERCION o más abajo (al insertar n filas) y, si es relativo, delta filas (al copiar la fila)
+    __slots__ = ('formato', 'filas', 'solo_desplazables')
+
+    def __init__(self, moldear):
+        # moldear(marcar) devuelve el XML con marcar(fila, relativa) en lugar de cada número de fila
+        filas = []
+
+        def marcar(fila, relativa):
+            if fila < FILA_INSERCION and not relativa:
+                return fila
+            filas.append((fila, fila >= FILA_INSERCION, relativa))
+            return f"\0{len(filas) - 1}\0"
+
+        trozos = moldear(marcar).split('\0')
+        self.filas = [filas[int(i)] for i in trozos[1::2]]
+        # Los textos, con un %d en el lugar de cada fila, para rellenarlos con una sola operación
+        self.formato = '%d'.join(texto.replace('%', '%%') for texto in trozos[0::2]) if self.filas else trozos[0]
+        self.solo_desplazables = all(desplazable and not relativa for _, desplazable, relativa in self.filas)
+        if self.solo_desplazables:
+            self.filas = [fila for fila, _, _ in self.filas]
+
+    def rellenar(self, n=0, delta=0):
+        if not self.filas:
+            return self.formato
+        if self.solo_desplazables:
+            return self.formato % tuple([fila + n for fila in self.filas])
+        return self.formato % tuple([fila + (n if desplazable else 0) + (delta if relativa else 0)
+                                     for fila, desplazable, relativa in self.filas])
+
+
+def _moldear_copia(fila_xml, origen, marcar):
+    # La fila origen copiada delta filas más abajo, con delta sin resolver: la fila y sus celdas pasan a
+    # origen + delta, las referencias relativas se mueven delta filas y las compartidas apuntan a su fórmula
+    def fila(m):
+        return f'{m.group(1)}{marcar(origen, True)}"'
+
+    fila_xml = re.sub(r'(<row r=")\d+"', fila, fila_xml, count=1)
+    fila_xml = re.sub(rf'(<c r="[A-Z]+){origen}"', fila, fila_xml)
+
+    def copiar_formula(m):
+        atributos, texto = m.group(1), m.group(2)
+        if 't="shared"' in atributos:
+            si = re.search(r'si="(\d+)"', atributos).group(1)
+            return f'<f t="shared" si="{si}"/>'
+        atributos = _RE_ATRIBUTO_REF.sub(
+            lambda a: a.group(1) + _mover_referencias(a.group(2), lambda f, absoluta: marcar(f, False)) + a.group(3),
+            atributos)
+        return f'<f{atributos}>{_mover_referencias(texto or "", lambda f, absoluta: marcar(f, not absoluta))}</f>'
+    return _RE_FORMULA.sub(copiar_formula, fila_xml)
+
+
+class _Hoja:
+    # La hoja de la plantilla analizada una vez: lo que va antes y después de las filas, cada fila
+    # y la copia de la fila modelo, como moldes que dependen de las filas insertadas
+    def __init__(self, xml):
+        # Los valores guardados de las fórmulas ya no valen: Excel los recalcula al abrir
+        xml = _RE_VALOR_CACHEADO.sub(r'\1', xml)
+        inicio = xml.index('<sheetData>') + len('<sheetData>')
+        fin = xml.index('</sheetData>')
+
+        def desplazar(texto):
+            return lambda marcar: _sustituir_filas(texto, lambda fila, absoluta: marcar(fila, False))
+
+        self.cabecera = _Molde(desplazar(xml[:inicio]))
+        self.pie = _Molde(desplazar(xml[fin:]))
+        self.filas = [(int(m.group(1)), _Molde(desplazar(m.group(0)))) for m in _RE_FILA.finditer(xml, inicio, fin)]
+        modelo = next(m.group(0) for m in _RE_FILA.finditer(xml, inicio, fin) if int(m.group(1)) == FILA_MODELO)
+        self.copia_modelo = _Molde(lambda marcar: _moldear_copia(modelo, FILA_MODELO, marcar))
+
+    def rellenar(self, tramos_finales, seccion, preparacion, descanso, cada):
+        extra_rows = max(len(tramos_finales) - FILAS_EN_PLANTILLA, 0)
+        filas = {fila + extra_rows if fila >= FILA_INSERCION else fila: molde.rellenar(extra_rows)
+                 for fila, molde in self.filas}
+        for i in range(extra_rows):
+            fila = FILA_INSERCION + i
+            filas[fila] = self.copia_modelo.rellenar(extra_rows, fila - FILA_MODELO)
+
+        _poner_valor(filas, 'C', 4, seccion)
+        _poner_valor(filas, 'E', 4, preparacion)
+        _poner_valor(filas, 'C', 6, descanso)
+        _poner_valor(filas, 'E', 6, cada)
+
+        for i, tramo in enumerate(tramos_finales):
+            fila = FILA_INICIAL + i
+            horizontal = tramo['distancia_m']
+            desnivel = tramo['elevacion_m']
+            if desnivel > 0:
+                tipo = "Ascenso"
+            elif desnivel < 0:
+                tipo = "Descenso"
+            else:
+                tipo = "Llano"
+
+            _poner_valor(filas, 'B', fila, i + 1)
+            _poner_valor(filas, 'C', fila, round(horizontal / 1000, 2))
+            _poner_valor(filas, 'D', fila, tipo)
+            _poner_valor(filas, 'E', fila, abs(desnivel))
+
+        return (self.cabecera.rellenar(extra_rows) + ''.join(filas[fila] for fila in sorted(filas))
+                + self.pie.rellenar(extra_rows))
+
+
+def nombre_hoja_valido(nombre, usados):
+    nombre = _CARACTERES_NO_VALIDOS.sub('_', nombre).strip("'")[:31] or 'Hoja'
+    candidato, n = nombre, 2
+    while candidato.lower() in usados:
+        sufijo = f" ({n})"
+        candidato = nombre[:31 - len(sufijo)] + sufijo
+        n += 1
+    usados.add(candidato.lower())
+    return candidato
+
+
+def _ruta_relativa(base, destino):
+    if destino.startswith('/'):
+        return destino[1:]
+    return f"{base}/{destino}"
+
+
+class Plantilla:
+    """
+    La plantilla leída y analizada: su paquete, la hoja que se rellena (ya separada en filas,
+    fila modelo y referencias que mueven las filas insertadas) y el resto de hojas.
+    Solo se lee: varias hojas o calculadores se pueden generar a la vez con la misma.
+    """
+
+    def __init__(self, partes):
+        self.partes = partes
+        self.primera, self.ruta_hoja, self.otras_hojas = _hoja_plantilla(partes)
+        self.nombre = unescape(_nombre(self.primera), {'&quot;': '"'})
+        self.rels_hoja = partes.get(_rels_de(self.ruta_hoja))
+        self._hoja = _Hoja(partes[self.ruta_hoja].decode('utf-8'))
+
+    def rellenar_hoja(self, tramos_finales, seccion, preparacion, descanso, cada):
+        return self._hoja.rellenar(tramos_finales, seccion, preparacion, descanso, cada)
+
+
+_PLANTILLAS = {}
+
+
+def leer_plantilla(ruta):
+    """
+    Devuelve la Plantilla de la ruta. Se analiza una vez por proceso y se vuelve a leer solo si el
+    archivo cambia. generar_calculador y actualizar_calculador admiten la ruta o la Plantilla.
+    """
+    if isinstance(ruta, Plantilla):
+        return ruta
+    st = os.stat(ruta)
+    clave = (os.path.abspath(ruta), st.st_size, st.st_mtime_ns)
+    plantilla = _PLANTILLAS.get(clave)
+    if plantilla is None:
+        plantilla = _PLANTILLAS[clave] = Plantilla(_leer_paquete(ruta))
+    return plantilla
+
+
+def _leer_paquete(ruta):
+    with zipfile.ZipFile(ruta) as zin:
+        return {info.filename: zin.read(info) for info in zin.infolist()}
+
+
+def _escribir_zip(destino, partes):
+    with zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as zout:
+        for nombre, contenido in partes.items():
+            zout.writestr(nombre, contenido)
+
+
+def _escribir_paquete(ruta, partes):
+    if hasattr(ruta, 'write'):
+        # Un archivo ya abierto (por ejemplo, un BytesIO para enviarlo sin pasar por disco)
+        _escribir_zip(ruta, partes)
+        return
+    # Se escribe aparte y se sustituye al final, para no dejar a medias un calculador que ya existía
+    with escribir_atomico(ruta) as f:
+        _escribir_zip(f, partes)
+
+
+def _destinos(rels):
+    return {m.group(1): m.group(2) for m in re.finditer(r'<Relationship Id="([^"]+)"[^>]*?Target="([^"]+)"', rels)}
+
+
+def _nombre(hoja):
+    return re.search(r'name="([^"]*)"', hoja).group(1)
+
+
+def _ruta_hoja(hoja, destinos):
+    return _ruta_relativa('xl', destinos[re.search(r'r:id="([^"]+)"', hoja).group(1)])
+
+
+def _rels_de(ruta):
+    return ruta.replace('worksheets/', 'worksheets/_rels/') + '.rels'
+
+
+def _hoja_plantilla(partes):
+    # (elemento <sheet> de la primera hoja, ruta de su XML, resto de elementos <sheet>)
+    workbook = partes['xl/workbook.xml'].decode('utf-8')
+    destinos = _destinos(partes['xl/_rels/workbook.xml.rels'].decode('utf-8'))
+    hojas = re.findall(r'<sheet [^>]*?/>', workbook)
+    return hojas[0], _ruta_hoja(hojas[0], destinos), hojas[1:]
+
+
+def _nueva_hoja(partes, xml, xml_rels, nombre, siguiente_id, siguiente_rid):
+    # Añade el XML de una hoja al paquete; devuelve su <sheet>, su <Relationship> y su <Override>
+    siguiente_hoja = 1
+    while f'xl/worksheets/sheet{siguiente_hoja}.xml' in partes:
+        siguiente_hoja += 1
+    ruta = f'xl/worksheets/sheet{siguiente_hoja}.xml'
+    partes[ruta] = xml.replace(' tabSelected="1"', '').encode('utf-8')
+    if xml_rels is not None:
+        partes[_rels_de(ruta)] = xml_rels
+    return (f'<sheet name="{nombre}" sheetId="{siguiente_id}" r:id="rId{siguiente_rid}"/>',
+            f'<Relationship Id="rId{siguiente_rid}" Type="{_REL_HOJA}" Target="{ruta[3:]}"/>',
+            f'<Override PartName="/{ruta}" ContentType="{_TIPO_HOJA}"/>')
+
+
+def _cerrar_libro(partes, workbook, rels, tipos, todas):
+    # Con filas nuevas la cadena de cálculo deja de ser válida: se elimina y se pide recalcular al abrir
+    for rid, destino in list(_destinos(rels).items()):
+        if re.search(rf'<Relationship Id="{rid}" Type="{re.escape(_REL_CALCCHAIN)}"', rels):
+            rels = re.sub(rf'<Relationship Id="{rid}"[^>]*/>', '', rels)
+            ruta = _ruta_relativa('xl', destino)
+            partes.pop(ruta, None)
+            tipos = re.sub(rf'<Override PartName="/{re.escape(ruta)}"[^>]*/>', '', tipos)
+    if 'fullCalcOnLoad' not in workbook:
+        workbook = re.sub(r'<calcPr\b', '<calcPr fullCalcOnLoad="1"', workbook, count=1)
+
+    workbook = re.sub(r'<sheets>.*?</sheets>', lambda m: '<sheets>' + ''.join(todas) + '</sheets>', workbook, flags=re.S)
+    partes['xl/workbook.xml'] = workbook.encode('utf-8')
+    partes['xl/_rels/workbook.xml.rels'] = rels.encode('utf-8')
+    partes['[Content_Types].xml'] = tipos.encode('utf-8')
+
+    if 'docProps/app.xml' in partes:
+        partes['docProps/app.xml'] = _actualizar_app_xml(partes['docProps/app.xml'].decode('utf-8'), todas).encode('utf-8')
+
+
+def _escapar_nombre(nombre):
+    return escape(nombre, {'"': '&quot;'})
+
+
+def generar_calculador(plantilla, salida, hojas, seccion, preparacion, descanso, cada):
+    """
+    Genera el calculador a partir de la plantilla, con una hoja por elemento de hojas.
+    plantilla es la ruta o una Plantilla (leer_plantilla); salida, una ruta o un archivo binario abierto.
+    hojas es una lista de (nombre, tramos_finales); con nombre None se conserva el de la plantilla.
+    Devuelve los nombres que han recibido las hojas (cambian si no son válidos o están repetidos).
+    """
+    plantilla = leer_plantilla(plantilla)
+    # Las hojas nuevas se añaden a una copia del paquete; el de la plantilla no cambia
+    partes = dict(plantilla.partes)
+
+    workbook = partes['xl/workbook.xml'].decode('utf-8')
+    rels = partes['xl/_rels/workbook.xml.rels'].decode('utf-8')
+    tipos = partes['[Content_Types].xml'].decode('utf-8')
+
+    primera, ruta_plantilla, otras_hojas = plantilla.primera, plantilla.ruta_hoja, plantilla.otras_hojas
+
+    siguiente_id = max(int(i) for i in re.findall(r'sheetId="(\d+)"', workbook)) + 1
+    siguiente_rid = max(int(i) for i in re.findall(r'Id="rId(\d+)"', rels)) + 1
+
+    usados = {unescape(_nombre(h), {'&quot;': '"'}).lower() for h in otras_hojas}
+    nombres, nuevas_hojas, nuevas_rels, nuevos_tipos = [], [], [], []
+    for i, (nombre, tramos_finales) in enumerate(hojas):
+        xml = plantilla.rellenar_hoja(tramos_finales, seccion, preparacion, descanso, cada)
+        nombre = nombre_hoja_valido(nombre if nombre is not None else plantilla.nombre, usados)
+        nombres.append(nombre)
+
+        if i == 0:
+            partes[ruta_plantilla] = xml.encode('utf-8')
+            nuevas_hojas.append(re.sub(r'name="[^"]*"', f'name="{_escapar_nombre(nombre)}"', primera, count=1))
+            continue
+
+        hoja, rel, tipo = _nueva_hoja(partes, xml, plantilla.rels_hoja, _escapar_nombre(nombre),
+                                      siguiente_id, siguiente_rid)
+        nuevas_hojas.append(hoja)
+        nuevas_rels.append(rel)
+        nuevos_tipos.append(tipo)
+        siguiente_id += 1
+        siguiente_rid += 1
+
+    rels = rels.replace('</Relationships>', ''.join(nuevas_rels) + '</Relationships>')
+    tipos = tipos.replace('</Types>', ''.join(nuevos_tipos) + '</Types>')
+    # Hojas de rutas primero y después el resto de hojas de la plantilla (las tablas ocultas)
+    _cerrar_libro(partes, workbook, rels, tipos, nuevas_hojas + otras_hojas)
+    _escribir_paquete(salida, partes)
+    return nombres
+
+
+def actualizar_calculador(plantilla, salida, reemplazar, anadir, quitar, seccion, preparacion, descanso, cada):
+    """
+    Modifica un calculador hecho con generar_calculador sin tocar el resto de hojas.
+    reemplazar y anadir son listas de (nombre, tramos_finales) y quitar una lista de nombres de hoja.
+    Las hojas añadidas se colocan en orden alfabético entre las de rutas. Devuelve sus nombres.
+    """
+    partes = _leer_paquete(salida)
+    plantilla = leer_plantilla(plantilla)
+    de_la_plantilla = {_nombre(h) for h in plantilla.otras_hojas}
+
+    workbook = partes['xl/workbook.xml'].decode('utf-8')
+    rels = partes['xl/_rels/workbook.xml.rels'].decode('utf-8')
+    tipos = partes['[Content_Types].xml'].decode('utf-8')
+    destinos = _destinos(rels)
+    hojas = re.findall(r'<sheet [^>]*?/>', workbook)
+    rutas = [h for h in hojas if _nombre(h) not in de_la_plantilla]
+    resto = [h for h in hojas if _nombre(h) in de_la_plantilla]
+    por_nombre = {_nombre(h): h for h in rutas}
+
+    for nombre in quitar:
+        hoja = por_nombre.pop(_escapar_nombre(nombre))
+        rutas.remove(hoja)
+        ruta = _ruta_hoja(hoja, destinos)
+        partes.pop(ruta, None)
+        partes.pop(_rels_de(ruta), None)
+        rid = re.search(r'r:id="([^"]+)"', hoja).group(1)
+        rels = re.sub(rf'<Relationship Id="{rid}"[^>]*/>', '', rels)
+        tipos = re.sub(rf'<Override PartName="/{re.escape(ruta)}"[^>]*/>', '', tipos)
+
+    for nombre, tramos_finales in reemplazar:
+        ruta = _ruta_hoja(por_nombre[_escapar_nombre(nombre)], destinos)
+        xml = plantilla.rellenar_hoja(tramos_finales, seccion, preparacion, descanso, cada)
+        if ' tabSelected="1"' not in partes[ruta].decode('utf-8'):
+            xml = xml.replace(' tabSelected="1"', '')
+        partes[ruta] = xml.encode('utf-8')
+
+    siguiente_id = max(int(i) for i in re.findall(r'sheetId="(\d+)"', workbook)) + 1
+    siguiente_rid = max(int(i) for i in re.findall(r'Id="rId(\d+)"', rels)) + 1
+    usados = {unescape(_nombre(h), {'&quot;': '"'}).lower() for h in rutas + resto}
+    nombres = []
+    for nombre, tramos_finales in anadir:
+        xml = plantilla.rellenar_hoja(tramos_finales, seccion, preparacion, descanso, cada)
+        nombre = nombre_hoja_valido(nombre, usados)
+        nombres.append(nombre)
+        hoja, rel, tipo = _nueva_hoja(partes, xml, plantilla.rels_hoja, _escapar_nombre(nombre), siguiente_id, siguiente_rid)
+        rels = rels.replace('</Relationships>', rel + '</Relationships>')
+        tipos = tipos.replace('</Types>', tipo + '</Types>')
+        siguiente_id += 1
+        siguiente_rid += 1
+
+        posicion = next((i for i, h in enumerate(rutas) if unescape(_nombre(h), {'&quot;': '"'}) > nombre), len(rutas))
+        rutas.insert(posicion, hoja)
+
+    if not rutas:
+        raise ValueError("El calculador se quedaría sin hojas de rutas")
+    _cerrar_libro(partes, workbook, rels, tipos, rutas + resto)
+    _escribir_paquete(salida, partes)
+    return nombres
+
+
+def _actualizar_app_xml(app, hojas):
+    nombres = [re.search(r'name="([^"]*)"', h).group(1) for h in hojas]
+    titulos = ''.join(f'<vt:lpstr>{n}</vt:lpstr>' for n in nombres)
+    app = re.sub(r'(<TitlesOfParts><vt:vector size=")\d+(" baseType="lpstr">).*?(</vt:vector>)',
+                 lambda m: f'{m.group(1)}{len(nombres)}{m.group(2)}{titulos}{m.group(3)}', app, flags=re.S)
+    return re.sub(r'(<HeadingPairs>.*?<vt:i4>)\d+(</vt:i4>)', rf'\g<1>{len(nombres)}\g<2>', app, count=1, flags=re.S)
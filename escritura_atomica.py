@@ -0,0 +1,51 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Escritura atómica: se escribe en un temporal junto al archivo y se sustituye al final, así que nadie
+# ve nunca un archivo a medias y uno que ya existía se queda como estaba si algo falla. Uso:
+#   with escribir_atomico(ruta) as f:
+#       f.write(datos)
+# Si el bloque lanza una excepción, el temporal se borra y la excepción sigue. El nombre del temporal
+# (<ruta>.<pid>.<n>.tmp) es distinto en cada proceso y cada llamada, así que varios procesos o hilos
+# pueden escribir a la vez en la misma carpeta (por ejemplo, en la caché). El archivo se crea con los
+# permisos normales de un archivo nuevo.
+
+import contextlib
+import itertools
+import os
+
+_CONTADOR = itertools.count()
+
+
+@contextlib.contextmanager
+def escribir_atomico(ruta, modo='wb', encoding=None):
+    ruta = os.fspath(ruta)
+    temporal = f"{ruta}.{os.getpid()}.{next(_CONTADOR)}.tmp"
+    try:
+        # Cerrado antes de sustituirlo: en Windows no se puede reemplazar un archivo abierto
+        with open(temporal, modo, encoding=encoding) as f:
+            yield f
+        os.replace(temporal, ruta)
+    except BaseException:
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        raise
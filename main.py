@@ -18,15 +18,26 @@
 /* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
 """
 
-import gpxpy
+# gpxpy, xlwings, tkinter, escritor_xlsx y concurrent.futures se importan solo donde se usan:
+# el análisis y la línea de comandos (cli.py) arrancan sin cargar la interfaz ni Excel
+import bisect
+import functools
+import io
+import itertools
+import json
+from array import array
 import math
-import xlwings as xw
-from xlwings.constants import AutoFillType
-import tkinter as tk
-from tkinter import filedialog, messagebox
-from tkinter.ttk import Combobox
+import xml.etree.ElementTree as ET
+import zipfile
+import multiprocessing
 import os, sys, pathlib
 
+import entradas
+from cache_tramos import CacheTramos, huella_archivo
+from escritura_atomica import escribir_atomico
+from medidas import Cancelado, Medidas, etapa
+from puntos_binarios import EXTENSION as EXTENSION_BINARIA, PuntosBinarios, es_puntos_binarios, guardar_puntos
+
 help_texts = [
     "Longitud mínima (en metros) para que un tramo sea considerado. \nEj, si el valor es 100, todos los tramos menores a 100 metros serán juntados con siguiente tramo.\nPara eliminar esta variable, hay que ponerla a 0",
     "Diferencia mínima de elevación (en metros) que un tramo sea considerado. \nEj, si el valor es 10, todos los tramos con menos elevación que 10 metros serán juntados con el siguiente tramo.\nPara eliminar esta variable, hay que ponerla a 0",
@@ -69,101 +80,332 @@ def haversine(lat1, lon1, lat2, lon2):
     a = math.sin(dphi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2)**2
     return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
-def calcular_pendientes(gpx_file_path):
-    with open(gpx_file_path, 'r') as gpx_file:
+def _nombre_local(etiqueta):
+    # '{http://www.topografix.com/GPX/1/1}trkpt' -> 'trkpt'
+    return etiqueta.rpartition('}')[2]
+
+def leer_puntos_gpx(gpx_file_path):
+    # Lectura incremental: devuelve (lat, lon, ele) de cada trk/trkseg/trkpt según se lee,
+    # descartando los nodos ya procesados para que la memoria no crezca con el archivo.
+    # El GPX puede estar comprimido o dentro de un zip (entradas.py): se descomprime según se lee
+    with entradas.abrir(gpx_file_path) as archivo:
+        yield from _puntos_de_gpx(archivo)
+
+# Marcas que da _puntos_de_gpx con segmentos=True al cerrarse cada trkseg y cada trk
+_FIN_DE_SEGMENTO = 'fin de segmento'
+_FIN_DE_PISTA = 'fin de pista'
+
+def _puntos_de_gpx(archivo, segmentos=False):
+    pila = []
+    dentro_de_punto = 0
+
+    for evento, elem in ET.iterparse(archivo, events=('start', 'end')):
+        if evento == 'start':
+            if _nombre_local(elem.tag) == 'trkpt':
+                dentro_de_punto += 1
+            pila.append(elem)
+            continue
+
+        pila.pop()
+        if _nombre_local(elem.tag) == 'trkpt':
+            dentro_de_punto -= 1
+            # Solo los puntos de gpx/trk/trkseg, igual que gpxpy
+            if len(pila) == 3 and _nombre_local(pila[2].tag) == 'trkseg' and _nombre_local(pila[1].tag) == 'trk':
+                ele = None
+                for hijo in elem:
+                    if _nombre_local(hijo.tag) == 'ele':
+                        ele = hijo.text
+                        break
+                if ele is not None:
+                    elevacion = float(ele.strip())
+                    if elevacion > 5:
+                        yield float(elem.get('lat').strip()), float(elem.get('lon').strip()), elevacion
+        elif segmentos and _nombre_local(elem.tag) == 'trkseg' and len(pila) == 2 and _nombre_local(pila[1].tag) == 'trk':
+            yield _FIN_DE_SEGMENTO
+        elif segmentos and _nombre_local(elem.tag) == 'trk' and len(pila) == 1:
+            yield _FIN_DE_PISTA
+
+        # Los hijos de un trkpt se necesitan hasta que el punto se cierra
+        if pila and not dentro_de_punto:
+            pila[-1].remove(elem)
+
+def leer_puntos_gpxpy(gpx_file_path):
+    import gpxpy
+    with io.TextIOWrapper(entradas.abrir(gpx_file_path)) as gpx_file:
         gpx = gpxpy.parse(gpx_file)
 
-    puntos = []
     for track in gpx.tracks:
         for segment in track.segments:
             for point in segment.points:
                 if point.elevation is not None and point.elevation > 5:
-                    puntos.append((point.latitude, point.longitude, point.elevation))
+                    yield point.latitude, point.longitude, point.elevation
 
-    pendientes = []
-    for i in range(1, len(puntos)):
-        lat1, lon1, ele1 = puntos[i - 1]
-        lat2, lon2, ele2 = puntos[i]
-        distancia_horizontal = haversine(lat1, lon1, lat2, lon2)
-        delta_elevacion = ele2 - ele1
+# --- Tramos ------------------------------------------------------------------
+# Un Tramo ocupa mucho menos que un diccionario con las mismas claves. Este archivo usa sus
+# atributos; el resto puede seguir tratándolo como el diccionario de siempre
+# (tramo['distancia_m'], tramo.get('pendiente_%'), dict(tramo), {**tramo}...). Las etapas, los agrupar_*
+# y calcular_pendiente_y_enumerar aceptan también listas de diccionarios.
 
-        if distancia_horizontal > 0:
-            pendientes.append({
-                'distancia_m': distancia_horizontal,
-                'elevacion_m': delta_elevacion
-            })
+class Tramo:
+    __slots__ = ('distancia_m', 'elevacion_m', 'tramo', 'pendiente')
 
-    return pendientes
+    # Clave del diccionario -> atributo
+    _CLAVES = {'distancia_m': 'distancia_m', 'elevacion_m': 'elevacion_m', 'tramo': 'tramo', 'pendiente_%': 'pendiente'}
 
-def agrupar_por_direccion(tramos):
-    if not tramos:
-        return []
+    def __init__(self, distancia_m, elevacion_m, tramo=None, pendiente=None):
+        self.distancia_m = distancia_m
+        self.elevacion_m = elevacion_m
+        self.tramo = tramo
+        self.pendiente = pendiente
+
+    @classmethod
+    def desde_dict(cls, datos):
+        return cls(datos['distancia_m'], datos['elevacion_m'], datos.get('tramo'), datos.get('pendiente_%'))
+
+    def copy(self):
+        return Tramo(self.distancia_m, self.elevacion_m, self.tramo, self.pendiente)
 
-    agrupados = []
-    tramo_actual = tramos[0].copy()
-    direccion = tramo_actual['elevacion_m'] >= 0
+    def keys(self):
+        # 'tramo' y 'pendiente_%' solo existen una vez enumerado, igual que en el diccionario
+        return [clave for clave, atributo in self._CLAVES.items() if getattr(self, atributo) is not None]
+
+    def values(self):
+        return [self[clave] for clave in self.keys()]
+
+    def items(self):
+        return [(clave, self[clave]) for clave in self.keys()]
+
+    def get(self, clave, defecto=None):
+        try:
+            return self[clave]
+        except KeyError:
+            return defecto
 
-    for tramo in tramos[1:]:
-        misma_direccion = (tramo['elevacion_m'] >= 0) == direccion
+    def __getitem__(self, clave):
+        try:
+            valor = getattr(self, self._CLAVES[clave])
+        except KeyError:
+            raise KeyError(clave) from None
+        if valor is None:
+            raise KeyError(clave)
+        return valor
+
+    def __setitem__(self, clave, valor):
+        try:
+            setattr(self, self._CLAVES[clave], valor)
+        except KeyError:
+            raise KeyError(f"Un tramo no tiene la clave {clave!r}") from None
+
+    def __contains__(self, clave):
+        return clave in self._CLAVES and getattr(self, self._CLAVES[clave]) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, otro):
+        if isinstance(otro, (Tramo, dict)):
+            return dict(self) == dict(otro)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Tramo({dict(self)!r})"
+
+def leer_puntos_binarios(ruta):
+    with PuntosBinarios(ruta) as puntos:
+        yield from puntos
+
+def leer_puntos(ruta, streaming=True):
+    # Los (lat, lon, ele) de la ruta, de un .gpx o de un .gxb ya convertido (puntos_binarios.py)
+    if es_puntos_binarios(ruta):
+        return leer_puntos_binarios(ruta)
+    return leer_puntos_gpx(ruta) if streaming else leer_puntos_gpxpy(ruta)
+
+def convertir_gpx(gpx_file, salida=None):
+    # Guarda los puntos de la ruta y la distancia acumulada en un .gxb, que se puede usar en lugar del GPX.
+    # Devuelve la ruta del archivo creado (por defecto, junto al GPX o al zip que lo contiene)
+    latitudes, longitudes, elevaciones, distancia_acumulada = array('d'), array('d'), array('d'), array('d')
+    total = 0.0
+    for lat, lon, ele in leer_puntos_gpx(gpx_file):
+        if latitudes:
+            total += haversine(latitudes[-1], longitudes[-1], lat, lon)
+        latitudes.append(lat)
+        longitudes.append(lon)
+        elevaciones.append(ele)
+        distancia_acumulada.append(total)
+
+    if salida is None:
+        if isinstance(gpx_file, entradas.MiembroZip):
+            salida = gpx_file.zip.parent / f"{gpx_file.stem}{EXTENSION_BINARIA}"
+        else:
+            salida = entradas.sin_compresion(gpx_file).with_suffix(EXTENSION_BINARIA)
+    guardar_puntos(salida, latitudes, longitudes, elevaciones, distancia_acumulada)
+    return salida
+
+def generar_pendientes(puntos):
+    anterior = None
+    for lat2, lon2, ele2 in puntos:
+        if anterior is not None:
+            lat1, lon1, ele1 = anterior
+            distancia_horizontal = haversine(lat1, lon1, lat2, lon2)
+            delta_elevacion = ele2 - ele1
+
+            if distancia_horizontal > 0:
+                yield Tramo(distancia_horizontal, delta_elevacion)
+        anterior = (lat2, lon2, ele2)
+
+def calcular_pendientes(gpx_file_path, streaming=True):
+    return list(generar_pendientes(leer_puntos(gpx_file_path, streaming)))
+
+# --- Etapas en cadena -------------------------------------------------------
+# Cada etapa es un generador que recibe tramos y devuelve tramos, manteniendo solo
+# el tramo en curso. Encadenadas, procesan la ruta en una sola pasada con memoria acotada.
+# Admiten tanto Tramo como los diccionarios de siempre ({'distancia_m': ..., 'elevacion_m': ...}).
+
+def _como_tramos(tramos):
+    # Los diccionarios se pasan a Tramo. Basta con mirar el primero: las listas son de un solo tipo,
+    # y así la cadena de Tramo no paga una comprobación por cada segmento
+    tramos = iter(tramos)
+    primero = next(tramos, None)
+    if primero is None:
+        return iter(())
+    tramos = itertools.chain((primero,), tramos)
+    if type(primero) is Tramo:
+        return tramos
+    return (tramo if type(tramo) is Tramo else Tramo.desde_dict(tramo) for tramo in tramos)
+
+def _juntar(tramo_actual, tramo):
+    tramo_actual.distancia_m += tramo.distancia_m
+    tramo_actual.elevacion_m += tramo.elevacion_m
+
+def etapa_por_direccion(tramos):
+    tramo_actual = None
+
+    for tramo in _como_tramos(tramos):
+        if tramo_actual is None:
+            tramo_actual = tramo.copy()
+            direccion = tramo_actual.elevacion_m >= 0
+            continue
+
+        misma_direccion = (tramo.elevacion_m >= 0) == direccion
         if misma_direccion:
-            tramo_actual['distancia_m'] += tramo['distancia_m']
-            tramo_actual['elevacion_m'] += tramo['elevacion_m']
+            _juntar(tramo_actual, tramo)
         else:
-            agrupados.append(tramo_actual)
+            yield tramo_actual
             tramo_actual = tramo.copy()
-            direccion = tramo_actual['elevacion_m'] >= 0
+            direccion = tramo_actual.elevacion_m >= 0
 
-    agrupados.append(tramo_actual)
-    return agrupados
+    if tramo_actual is not None:
+        yield tramo_actual
 
-def agrupar_por_umbral(tramos, umbral_elevacion):
-    if not tramos:
-        return []
+def etapa_por_umbral(tramos, umbral_elevacion):
+    tramo_actual = None
 
-    finales = []
-    tramo_actual = tramos[0].copy()
+    for tramo in _como_tramos(tramos):
+        if tramo_actual is None:
+            tramo_actual = tramo.copy()
+        elif abs(tramo.elevacion_m) < umbral_elevacion:
+            _juntar(tramo_actual, tramo)
+        elif abs(tramo.elevacion_m)/abs(tramo.distancia_m)>0.6:
+            _juntar(tramo_actual, tramo)
+        else:
+            yield tramo_actual
+            tramo_actual = tramo.copy()
 
-    for tramo in tramos[1:]:
-        if abs(tramo['elevacion_m']) < umbral_elevacion:
-            tramo_actual['distancia_m'] += tramo['distancia_m']
-            tramo_actual['elevacion_m'] += tramo['elevacion_m']
-        elif abs(tramo['elevacion_m'])/abs(tramo['distancia_m'])>0.6:
-            tramo_actual['distancia_m'] += tramo['distancia_m']
-            tramo_actual['elevacion_m'] += tramo['elevacion_m']
+    if tramo_actual is not None:
+        yield tramo_actual
 
+def etapa_por_umbral2(tramos, max_pendiente,min_tramo,distancia_horizontal, delta_elevacion):
+    tramo_actual = None
+
+    for tramo in _como_tramos(tramos):
+        if tramo_actual is None:
+            tramo_actual = tramo.copy()
+        elif abs(tramo.elevacion_m)/abs(tramo.distancia_m)>max_pendiente:
+            _juntar(tramo_actual, tramo)
+        elif abs(tramo.distancia_m) < min_tramo:
+            _juntar(tramo_actual, tramo)
+        elif abs(tramo.distancia_m) < distancia_horizontal and abs(tramo.elevacion_m) < delta_elevacion:
+            _juntar(tramo_actual, tramo)
         else:
-            finales.append(tramo_actual)
+            yield tramo_actual
             tramo_actual = tramo.copy()
 
-    finales.append(tramo_actual)
-    return finales
+    if tramo_actual is not None:
+        yield tramo_actual
 
-def agrupar_por_umbral2(tramos, max_pendiente,min_tramo,distancia_horizontal, delta_elevacion):
-    if not tramos:
-        return []
-
-    finales = []
-    tramo_actual = tramos[0].copy()
-
-    for tramo in tramos[1:]:
-        if abs(tramo['elevacion_m'])/abs(tramo['distancia_m'])>max_pendiente:
-            tramo_actual['distancia_m'] += tramo['distancia_m']
-            tramo_actual['elevacion_m'] += tramo['elevacion_m']
-        elif abs(tramo['distancia_m']) < min_tramo:
-            tramo_actual['distancia_m'] += tramo['distancia_m']
-            tramo_actual['elevacion_m'] += tramo['elevacion_m']
-        elif abs(tramo['distancia_m']) < distancia_horizontal and abs(tramo['elevacion_m']) < delta_elevacion:
-            tramo_actual['distancia_m'] += tramo['distancia_m']
-            tramo_actual['elevacion_m'] += tramo['elevacion_m']
+def _pendientes_validas(x, y, minima, maxima, tolerancia):
+    # (x, y) es el final del tramo en curso, que pasaría a ser un punto intermedio: la recta desde
+    # el inicio del tramo tiene que pasar a menos de `tolerancia` de él. Devuelve el nuevo margen de pendientes
+    return max(minima, (y - tolerancia) / x), min(maxima, (y + tolerancia) / x)
+
+def etapa_decimar(tramos, tolerancia):
+    # Simplifica el perfil (distancia acumulada, elevación): junta segmentos seguidos mientras la recta
+    # que los une no se separe más de `tolerancia` metros en vertical de ningún punto intermedio.
+    # Una sola pasada, guardando solo el margen de pendientes que aún cumple con todos los puntos.
+    tramo_actual = None
+
+    for tramo in _como_tramos(tramos):
+        if tramo_actual is None:
+            tramo_actual = tramo.copy()
+            minima, maxima = -math.inf, math.inf
+            continue
+
+        nueva_minima, nueva_maxima = _pendientes_validas(tramo_actual.distancia_m, tramo_actual.elevacion_m,
+                                                         minima, maxima, tolerancia)
+        pendiente = (tramo_actual.elevacion_m + tramo.elevacion_m) / (tramo_actual.distancia_m + tramo.distancia_m)
+        if nueva_minima <= pendiente <= nueva_maxima:
+            _juntar(tramo_actual, tramo)
+            minima, maxima = nueva_minima, nueva_maxima
         else:
-            finales.append(tramo_actual)
+            yield tramo_actual
             tramo_actual = tramo.copy()
+            minima, maxima = -math.inf, math.inf
 
-    finales.append(tramo_actual)
-    return finales
+    if tramo_actual is not None:
+        yield tramo_actual
 
-def calcular_pendiente_y_enumerar(tramos):
+def etapa_primer_tramo(tramos, umbral_elevacion, longitud_minima_tramo):
+    # Si el primer tramo es demasiado pequeño se suma al segundo
+    tramos = _como_tramos(tramos)
+    primero = next(tramos, None)
+    if primero is None:
+        return
+
+    if abs(primero.elevacion_m) < umbral_elevacion or abs(
+            primero.distancia_m < longitud_minima_tramo):
+        segundo = next(tramos, None)
+        if segundo is not None:
+            _juntar(segundo, primero)
+            primero = segundo
+
+    yield primero
+    yield from tramos
+
+def etapa_enumerar(tramos):
     for i, tramo in enumerate(tramos, 1):
+        _pendiente_y_numero(tramo, i)
+        yield tramo
+
+def decimar_perfil(tramos, tolerancia):
+    return list(etapa_decimar(tramos, tolerancia))
+
+def agrupar_por_direccion(tramos):
+    return list(etapa_por_direccion(tramos))
+
+def agrupar_por_umbral(tramos, umbral_elevacion):
+    return list(etapa_por_umbral(tramos, umbral_elevacion))
+
+def agrupar_por_umbral2(tramos, max_pendiente,min_tramo,distancia_horizontal, delta_elevacion):
+    return list(etapa_por_umbral2(tramos, max_pendiente, min_tramo, distancia_horizontal, delta_elevacion))
+
+def _pendiente_y_numero(tramo, i):
+    if type(tramo) is not Tramo:
+        # Un diccionario: se actualiza el del llamante, como siempre
         if tramo['distancia_m'] > 0:
             pendiente = (tramo['elevacion_m'] / tramo['distancia_m']) * 100
         else:
@@ -172,16 +414,207 @@ def calcular_pendiente_y_enumerar(tramos):
         tramo['pendiente_%'] = round(pendiente, 2)
         tramo['distancia_m'] = round(tramo['distancia_m'], 2)
         tramo['elevacion_m'] = round(tramo['elevacion_m'], 2)
+        return
+    if tramo.distancia_m > 0:
+        pendiente = (tramo.elevacion_m / tramo.distancia_m) * 100
+    else:
+        pendiente = 0
+    tramo.tramo = i
+    tramo.pendiente = round(pendiente, 2)
+    tramo.distancia_m = round(tramo.distancia_m, 2)
+    tramo.elevacion_m = round(tramo.elevacion_m, 2)
+
+def calcular_pendiente_y_enumerar(tramos):
+    for i, tramo in enumerate(tramos, 1):
+        _pendiente_y_numero(tramo, i)
     return tramos
 
-def get_tramos_finales(gpx_file, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
-         longitud_horizontal_minima, elevacion_minima_asociada,):
-    tramos_raw = calcular_pendientes(gpx_file)
-    tramos_direccion = agrupar_por_direccion(tramos_raw)
-    tramos_umbral = agrupar_por_umbral(tramos_direccion, umbral_elevacion)
-    tramos_mix = agrupar_por_direccion(tramos_umbral)
+# --- Motor vectorizado (numpy) ---------------------------------------------
+# Mismo algoritmo que las funciones de arriba, pero con los tramos como dos columnas
+# (distancias y elevaciones) en lugar de una lista de diccionarios.
+
+# Longitud de grupo hasta la que las sumas se hacen por posición; los grupos más largos se suman uno a uno
+_LONGITUD_SUMA_VECTORIZADA = 64
+
+def _importar_numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("El motor 'numpy' necesita tener numpy instalado (pip install numpy)") from None
+    return np
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    np = _importar_numpy()
+    R = 6371000
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = np.radians(lat2 - lat1)
+    dlambda = np.radians(lon2 - lon1)
+
+    a = np.sin(dphi/2)**2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda/2)**2
+    return 2 * R * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def calcular_pendientes_np(gpx_file_path, streaming=True):
+    np = _importar_numpy()
+    if es_puntos_binarios(gpx_file_path):
+        # Vistas sobre el archivo, sin copiarlo. Lo que se calcula con ellas son arrays nuevos,
+        # así que el mmap se cierra al salir (en Windows, si no, no se podría reemplazar el .gxb)
+        with PuntosBinarios(gpx_file_path) as puntos:
+            columnas = puntos.columnas_np(np)
+            resultado = _pendientes_np(np, *columnas[:3])
+            del columnas
+        return resultado
+
+    lector = leer_puntos_gpx if streaming else leer_puntos_gpxpy
+    puntos = np.fromiter(itertools.chain.from_iterable(lector(gpx_file_path)), dtype=np.float64).reshape(-1, 3)
+    return _pendientes_np(np, puntos[:, 0], puntos[:, 1], puntos[:, 2])
+
+def _pendientes_np(np, lat, lon, ele):
+    distancias = haversine_np(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    elevaciones = ele[1:] - ele[:-1]
+
+    validos = distancias > 0
+    return distancias[validos], elevaciones[validos]
+
+def _sumar_grupos_np(np, valores, inicios):
+    # Suma cada grupo valores[inicios[i]:inicios[i+1]] de izquierda a derecha, en el mismo orden
+    # que el motor Python, para que los umbrales den exactamente los mismos cortes
+    longitudes = np.diff(np.append(inicios, len(valores)))
+    sumas = valores[inicios].copy()
+
+    activos = np.arange(len(inicios))
+    for k in range(1, _LONGITUD_SUMA_VECTORIZADA):
+        activos = activos[longitudes[activos] > k]
+        if not len(activos):
+            return sumas
+        sumas[activos] += valores[inicios[activos] + k]
+
+    for i in activos[longitudes[activos] > _LONGITUD_SUMA_VECTORIZADA]:
+        inicio = inicios[i] + _LONGITUD_SUMA_VECTORIZADA
+        resto = valores[inicio:inicios[i] + longitudes[i]]
+        sumas[i] = np.add.accumulate(np.concatenate(([sumas[i]], resto)))[-1]
+    return sumas
+
+def _unir_np(np, distancias, elevaciones, une_con_anterior):
+    # une_con_anterior[i] indica que el tramo i se suma al tramo en curso (el primero nunca)
+    une_con_anterior[0] = False
+    inicios = np.flatnonzero(~une_con_anterior)
+    return _sumar_grupos_np(np, distancias, inicios), _sumar_grupos_np(np, elevaciones, inicios)
+
+def decimar_perfil_np(distancias, elevaciones, tolerancia):
+    np = _importar_numpy()
+    if not len(distancias):
+        return distancias, elevaciones
+
+    # Qué puntos se quitan depende de los anteriores, así que se recorre en orden como etapa_decimar;
+    # las sumas de cada grupo sí van vectorizadas
+    juntar = np.zeros(len(distancias), dtype=bool)
+    x = y = 0.0
+    minima, maxima = -math.inf, math.inf
+    for i, (d, e) in enumerate(zip(distancias.tolist(), elevaciones.tolist())):
+        if i:
+            nueva_minima, nueva_maxima = _pendientes_validas(x, y, minima, maxima, tolerancia)
+            if nueva_minima <= (y + e) / (x + d) <= nueva_maxima:
+                juntar[i] = True
+                x += d
+                y += e
+                minima, maxima = nueva_minima, nueva_maxima
+                continue
+        x, y = d, e
+        minima, maxima = -math.inf, math.inf
+    return _unir_np(np, distancias, elevaciones, juntar)
+
+def agrupar_por_direccion_np(distancias, elevaciones):
+    np = _importar_numpy()
+    if not len(distancias):
+        return distancias, elevaciones
+
+    direccion = elevaciones >= 0
+    misma_direccion = np.empty(len(direccion), dtype=bool)
+    misma_direccion[1:] = direccion[1:] == direccion[:-1]
+    return _unir_np(np, distancias, elevaciones, misma_direccion)
+
+def agrupar_por_umbral_np(distancias, elevaciones, umbral_elevacion):
+    np = _importar_numpy()
+    if not len(distancias):
+        return distancias, elevaciones
+
+    # La decisión de juntar solo depende del tramo entrante, no del acumulado
+    juntar = (np.abs(elevaciones) < umbral_elevacion) | (np.abs(elevaciones)/np.abs(distancias) > 0.6)
+    return _unir_np(np, distancias, elevaciones, juntar)
+
+def agrupar_por_umbral2_np(distancias, elevaciones, max_pendiente, min_tramo, distancia_horizontal, delta_elevacion):
+    np = _importar_numpy()
+    if not len(distancias):
+        return distancias, elevaciones
+
+    juntar = ((np.abs(elevaciones)/np.abs(distancias) > max_pendiente)
+              | (np.abs(distancias) < min_tramo)
+              | ((np.abs(distancias) < distancia_horizontal) & (np.abs(elevaciones) < delta_elevacion)))
+    return _unir_np(np, distancias, elevaciones, juntar)
+
+def _pasada_np(medidas, nombre, funcion, distancias, elevaciones, *argumentos):
+    with etapa(medidas, nombre, len(distancias)) as e:
+        distancias, elevaciones = funcion(distancias, elevaciones, *argumentos)
+        e.salida = len(distancias)
+    return distancias, elevaciones
+
+def _agrupar_np(distancias, elevaciones, *parametros, medidas=None):
+    return _umbrales_np(*_pasada_np(medidas, 'agrupar_por_direccion', agrupar_por_direccion_np, distancias, elevaciones),
+                        *parametros, medidas=medidas)
+
+def _umbrales_np(distancias, elevaciones, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+         longitud_horizontal_minima, elevacion_minima_asociada, medidas=None):
+    # Las pasadas que dependen de los umbrales, a partir de la primera agrupación por dirección
+    distancias, elevaciones = _pasada_np(medidas, 'agrupar_por_umbral', agrupar_por_umbral_np,
+                                         distancias, elevaciones, umbral_elevacion)
+    distancias, elevaciones = _pasada_np(medidas, 'agrupar_por_direccion_2', agrupar_por_direccion_np,
+                                         distancias, elevaciones)
+
+    distancias, elevaciones = _pasada_np(medidas, 'agrupar_por_umbral2', agrupar_por_umbral2_np,
+        distancias,
+        elevaciones,
+        pendiente_maxima_valida,
+        longitud_minima_tramo,
+        longitud_horizontal_minima,
+        elevacion_minima_asociada
+    )
+    distancias, elevaciones = _pasada_np(medidas, 'agrupar_por_direccion_3', agrupar_por_direccion_np,
+                                         distancias, elevaciones)
+
+    return [Tramo(d, e) for d, e in zip(distancias.tolist(), elevaciones.tolist())]
+
+def _pasada(medidas, nombre, funcion, tramos, *argumentos):
+    with etapa(medidas, nombre, len(tramos) if hasattr(tramos, '__len__') else None) as e:
+        tramos = funcion(tramos, *argumentos)
+        e.salida = len(tramos)
+    return tramos
+
+def _agrupar_python(tramos_raw, *parametros, medidas=None):
+    return _umbrales_python(_pasada(medidas, 'agrupar_por_direccion', agrupar_por_direccion, tramos_raw),
+                            *parametros, medidas=medidas)
+
+def _umbrales_python(tramos_direccion, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+         longitud_horizontal_minima, elevacion_minima_asociada, medidas=None):
+    tramos_umbral = _pasada(medidas, 'agrupar_por_umbral', agrupar_por_umbral, tramos_direccion, umbral_elevacion)
+    tramos_mix = _pasada(medidas, 'agrupar_por_direccion_2', agrupar_por_direccion, tramos_umbral)
+
+    tramos_mix = _pasada(medidas, 'agrupar_por_umbral2', agrupar_por_umbral2,
+        tramos_mix,
+        pendiente_maxima_valida,
+        longitud_minima_tramo,
+        longitud_horizontal_minima,
+        elevacion_minima_asociada
+    )
+    return _pasada(medidas, 'agrupar_por_direccion_3', agrupar_por_direccion, tramos_mix)
+
+def _agrupar_stream(tramos_raw, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+         longitud_horizontal_minima, elevacion_minima_asociada):
+    # Las mismas pasadas que _agrupar_python, encadenadas sin listas intermedias
+    tramos_direccion = etapa_por_direccion(tramos_raw)
+    tramos_umbral = etapa_por_umbral(tramos_direccion, umbral_elevacion)
+    tramos_mix = etapa_por_direccion(tramos_umbral)
 
-    tramos_mix = agrupar_por_direccion(agrupar_por_umbral2(
+    return etapa_por_direccion(etapa_por_umbral2(
         tramos_mix,
         pendiente_maxima_valida,
         longitud_minima_tramo,
@@ -189,16 +622,499 @@ def get_tramos_finales(gpx_file, umbral_elevacion, pendiente_maxima_valida, long
         elevacion_minima_asociada
     ))
 
-    if abs(tramos_mix[0].get('elevacion_m')) < umbral_elevacion or abs(
-            tramos_mix[0].get('distancia_m') < longitud_minima_tramo):
-        tramos_mix[1]['distancia_m'] += tramos_mix[0]['distancia_m']
-        tramos_mix[1]['elevacion_m'] += tramos_mix[0]['elevacion_m']
-        tramos_mix.pop(0)
+def _tramos_mix_python(gpx_file, *parametros, medidas=None, decimar=0):
+    with etapa(medidas, 'calcular_pendientes') as e:
+        tramos_raw = calcular_pendientes(gpx_file)
+        e.salida = len(tramos_raw)
+    if decimar:
+        tramos_raw = _pasada(medidas, 'decimar', decimar_perfil, tramos_raw, decimar)
+    return _agrupar_python(tramos_raw, *parametros, medidas=medidas)
+
+def _tramos_mix_np(gpx_file, *parametros, medidas=None, decimar=0):
+    with etapa(medidas, 'calcular_pendientes') as e:
+        distancias, elevaciones = calcular_pendientes_np(gpx_file)
+        e.salida = len(distancias)
+    if decimar:
+        distancias, elevaciones = _pasada_np(medidas, 'decimar', decimar_perfil_np, distancias, elevaciones, decimar)
+    return _agrupar_np(distancias, elevaciones, *parametros, medidas=medidas)
+
+def _tramos_mix_stream(gpx_file, *parametros, medidas=None, decimar=0):
+    # Las pasadas van encadenadas, así que solo se puede medir la lectura y agrupación completas
+    with etapa(medidas, 'lectura_y_agrupacion') as e:
+        tramos_raw = generar_pendientes(leer_puntos(gpx_file))
+        if decimar:
+            tramos_raw = etapa_decimar(tramos_raw, decimar)
+        tramos_mix = list(_agrupar_stream(tramos_raw, *parametros))
+        e.salida = len(tramos_mix)
+    return tramos_mix
+
+MOTORES = {
+    'python': _tramos_mix_python,
+    'numpy': _tramos_mix_np,
+    'stream': _tramos_mix_stream,
+}
+
+def columnas_de_segmentos(gpx_file, motor='python'):
+    # Los segmentos de calcular_pendientes como dos columnas (distancias, elevaciones)
+    if motor == 'numpy':
+        return calcular_pendientes_np(gpx_file)
+
+    distancias, elevaciones = array('d'), array('d')
+    for tramo in generar_pendientes(leer_puntos(gpx_file)):
+        distancias.append(tramo.distancia_m)
+        elevaciones.append(tramo.elevacion_m)
+    return distancias, elevaciones
+
+def _tramos_mix_desde_columnas(distancias, elevaciones, motor, parametros, medidas=None, decimar=0):
+    if motor == 'numpy':
+        np = _importar_numpy()
+        distancias, elevaciones = np.asarray(distancias), np.asarray(elevaciones)
+        if decimar:
+            distancias, elevaciones = _pasada_np(medidas, 'decimar', decimar_perfil_np, distancias, elevaciones, decimar)
+        return _agrupar_np(distancias, elevaciones, *parametros, medidas=medidas)
+
+    tramos_raw = (Tramo(d, e) for d, e in zip(distancias, elevaciones))
+    if motor == 'stream':
+        with etapa(medidas, 'agrupacion', len(distancias)) as e:
+            if decimar:
+                tramos_raw = etapa_decimar(tramos_raw, decimar)
+            tramos_mix = list(_agrupar_stream(tramos_raw, *parametros))
+            e.salida = len(tramos_mix)
+        return tramos_mix
+    if decimar:
+        tramos_raw = _pasada(medidas, 'decimar', decimar_perfil, list(tramos_raw), decimar)
+    return _agrupar_python(tramos_raw, *parametros, medidas=medidas)
+
+def _primer_tramo(tramos, umbral_elevacion, longitud_minima_tramo):
+    return list(etapa_primer_tramo(tramos, umbral_elevacion, longitud_minima_tramo))
 
-    tramos_finales = calcular_pendiente_y_enumerar(tramos_mix)
+def get_tramos_finales(gpx_file, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+         longitud_horizontal_minima, elevacion_minima_asociada, motor='python', cache=None, medidas=None,
+         decimar=0, segmentos=False, procesos=1):
+    # cache: un CacheTramos (cache_tramos.py) para no repetir el análisis de archivos ya procesados
+    # medidas: un Medidas (medidas.py) en el que anotar el tiempo y los tramos de cada etapa
+    # decimar: tolerancia vertical (en metros) para simplificar el perfil antes de agrupar (0 = no simplificar)
+    # segmentos: agrupar cada trk/trkseg por separado y unir sus tramos (ver tramos_por_segmentos);
+    # procesos: con segmentos, número de procesos para los segmentos (None = todos los núcleos)
+    if motor not in MOTORES:
+        raise ValueError(f"Motor desconocido '{motor}'. Opciones: {', '.join(MOTORES)}")
+    parametros = (umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+                  longitud_horizontal_minima, elevacion_minima_asociada)
+
+    if segmentos:
+        # Los segmentos de la caché no guardan los cortes entre trkseg: solo se guardan los tramos
+        clave = (*parametros, decimar, 'segmentos')
+        if cache is not None:
+            with etapa(medidas, 'leer_cache') as e:
+                huella = cache.huella(gpx_file)
+                tramos_finales = cache.leer_tramos(huella, clave)
+                e.detalle = 'fallo' if tramos_finales is None else 'tramos'
+            if tramos_finales is not None:
+                return [Tramo.desde_dict(tramo) for tramo in tramos_finales]
+        tramos_finales = tramos_por_segmentos(gpx_file, *parametros, politica='unir', motor=motor, procesos=procesos,
+                                              medidas=medidas, decimar=decimar)[0][1]
+        if cache is not None:
+            cache.guardar_tramos(huella, clave, tramos_finales)
+        return tramos_finales
+
+    if cache is None:
+        tramos_mix = MOTORES[motor](gpx_file, *parametros, medidas=medidas, decimar=decimar)
+    else:
+        # Los segmentos se guardan sin simplificar; los tramos, según la tolerancia usada
+        clave = (*parametros, decimar) if decimar else parametros
+        with etapa(medidas, 'leer_cache') as e:
+            huella = cache.huella(gpx_file)
+            tramos_finales = cache.leer_tramos(huella, clave)
+            columnas = cache.leer_segmentos(huella) if tramos_finales is None else None
+            e.detalle = 'tramos' if tramos_finales is not None else 'segmentos' if columnas is not None else 'fallo'
+        if tramos_finales is not None:
+            return [Tramo.desde_dict(tramo) for tramo in tramos_finales]
+
+        if columnas is None:
+            with etapa(medidas, 'calcular_pendientes') as e:
+                columnas = columnas_de_segmentos(gpx_file, motor)
+                e.salida = len(columnas[0])
+            cache.guardar_segmentos(huella, *columnas)
+        tramos_mix = _tramos_mix_desde_columnas(*columnas, motor, parametros, medidas, decimar)
+
+    tramos_mix = _pasada(medidas, 'primer_tramo', _primer_tramo, tramos_mix, umbral_elevacion, longitud_minima_tramo)
+
+    tramos_finales = _pasada(medidas, 'calcular_pendiente_y_enumerar', calcular_pendiente_y_enumerar, tramos_mix)
+    if cache is not None:
+        cache.guardar_tramos(huella, clave, tramos_finales)
     return tramos_finales
 
+def iterar_tramos_finales(gpx_file, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+         longitud_horizontal_minima, elevacion_minima_asociada, decimar=0):
+    # Versión en streaming de get_tramos_finales: los tramos salen según se lee el GPX
+    tramos_raw = generar_pendientes(leer_puntos(gpx_file))
+    if decimar:
+        tramos_raw = etapa_decimar(tramos_raw, decimar)
+    tramos_mix = _agrupar_stream(tramos_raw, umbral_elevacion,
+                                 pendiente_maxima_valida, longitud_minima_tramo,
+                                 longitud_horizontal_minima, elevacion_minima_asociada)
+    return etapa_enumerar(etapa_primer_tramo(tramos_mix, umbral_elevacion, longitud_minima_tramo))
+
+# --- Pistas y segmentos -------------------------------------------------------
+# Sin segmentos, todos los puntos del GPX van seguidos y entre el final de un trk/trkseg y el principio
+# del siguiente sale un segmento falso (el salto de una pausa en la grabación o de una pista a otra).
+# Con segmentos, cada trkseg se agrupa por separado, en paralelo si procesos != 1, y sus tramos se
+# juntan según la política: 'unir' (una lista, como si fuese una ruta), 'pista' (una hoja por trk)
+# o 'segmento' (una hoja por trkseg).
+
+POLITICAS_SEGMENTOS = ('unir', 'pista', 'segmento')
+
+def segmentos_de_ruta(gpx_file):
+    # Devuelve [(pista, segmento, distancias, elevaciones)], numerados desde 1 según su orden en el GPX,
+    # sin los segmentos que no llegan a tener dos puntos. Un .gxb ya no guarda dónde empieza cada segmento: es uno solo
+    if es_puntos_binarios(gpx_file):
+        return [(1, 1, *columnas_de_segmentos(gpx_file))]
+
+    segmentos = []
+    pista = segmento = 1
+    distancias, elevaciones, anterior = array('d'), array('d'), None
+    with entradas.abrir(gpx_file) as archivo:
+        for punto in _puntos_de_gpx(archivo, segmentos=True):
+            if punto is _FIN_DE_SEGMENTO or punto is _FIN_DE_PISTA:
+                if distancias:
+                    segmentos.append((pista, segmento, distancias, elevaciones))
+                    distancias, elevaciones = array('d'), array('d')
+                anterior = None
+                if punto is _FIN_DE_PISTA:
+                    pista, segmento = pista + 1, 1
+                else:
+                    segmento += 1
+                continue
+            # Igual que generar_pendientes, dentro del segmento
+            if anterior is not None:
+                distancia_horizontal = haversine(anterior[0], anterior[1], punto[0], punto[1])
+                if distancia_horizontal > 0:
+                    distancias.append(distancia_horizontal)
+                    elevaciones.append(punto[2] - anterior[2])
+            anterior = punto
+    return segmentos
+
+def _tramos_de_segmento(distancias, elevaciones, motor, parametros, decimar=0):
+    # Los tramos de un segmento, sin enumerar
+    tramos_mix = _tramos_mix_desde_columnas(distancias, elevaciones, motor, parametros, decimar=decimar)
+    return _primer_tramo(tramos_mix, parametros[0], parametros[2])
+
+def tramos_por_segmentos(gpx_file, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+         longitud_horizontal_minima, elevacion_minima_asociada, politica='unir', motor='python', procesos=1,
+         medidas=None, decimar=0):
+    # Devuelve [(nombre de hoja, tramos)]: una sola hoja con 'unir' y una por pista o segmento con las demás
+    if politica not in POLITICAS_SEGMENTOS:
+        raise ValueError(f"Política de segmentos desconocida '{politica}'. Opciones: {', '.join(POLITICAS_SEGMENTOS)}")
+    if motor not in MOTORES:
+        raise ValueError(f"Motor desconocido '{motor}'. Opciones: {', '.join(MOTORES)}")
+    parametros = (umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+                  longitud_horizontal_minima, elevacion_minima_asociada)
+
+    with etapa(medidas, 'leer_segmentos') as e:
+        segmentos = segmentos_de_ruta(gpx_file)
+        e.salida = len(segmentos)
+        e.detalle = f"{sum(len(d) for _, _, d, _ in segmentos)} segmentos de recta"
+
+    with etapa(medidas, 'tramos_por_segmento', len(segmentos)) as e:
+        argumentos = [(d, el, motor, parametros, decimar) for _, _, d, el in segmentos]
+        if procesos == 1 or len(segmentos) < 2:
+            tramos = [_tramos_de_segmento(*a) for a in argumentos]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=procesos) as pool:
+                tramos = list(pool.map(_tramos_de_segmento, *zip(*argumentos)))
+        e.salida = sum(len(t) for t in tramos)
+
+    nombre = nombre_de_hoja(gpx_file)
+    if politica == 'unir':
+        grupos = [(None, [t for tramos_segmento in tramos for t in tramos_segmento])]
+    elif politica == 'pista':
+        grupos = []
+        for (pista, _, _, _), tramos_segmento in zip(segmentos, tramos):
+            if not grupos or grupos[-1][0] != pista:
+                grupos.append((pista, []))
+            grupos[-1][1].extend(tramos_segmento)
+        grupos = [(f"{nombre} {pista}", t) for pista, t in grupos]
+    else:
+        grupos = [(f"{nombre} {pista}-{segmento}", t) for (pista, segmento, _, _), t in zip(segmentos, tramos)]
+    return [(hoja, calcular_pendiente_y_enumerar(t)) for hoja, t in grupos]
+
+# --- Barrido de umbrales -----------------------------------------------------
+# Los segmentos y la primera agrupación por dirección no dependen de ningún umbral: se calculan
+# una vez y se evalúa sobre ellos toda una rejilla de valores de expertos.
+
+PARAMETROS = ('umbral_elevacion', 'pendiente_maxima_valida', 'longitud_minima_tramo',
+              'longitud_horizontal_minima', 'elevacion_minima_asociada')
+VALORES_POR_DEFECTO = {
+    'umbral_elevacion': 10,
+    'pendiente_maxima_valida': 0.6,
+    'longitud_minima_tramo': 100,
+    'longitud_horizontal_minima': 300,
+    'elevacion_minima_asociada': 25,
+}
+
+def _tramos_de_columnas(distancias, elevaciones):
+    return (Tramo(d, e) for d, e in zip(distancias, elevaciones))
+
+def prefijo_comun(gpx_file, motor='python', cache=None):
+    # Devuelve (distancias, elevaciones) de los segmentos y (distancias, elevaciones) tras agrupar por dirección
+    columnas = None
+    if cache is not None:
+        huella = cache.huella(gpx_file)
+        columnas = cache.leer_segmentos(huella)
+    if columnas is None:
+        columnas = columnas_de_segmentos(gpx_file, motor)
+        if cache is not None:
+            cache.guardar_segmentos(huella, *columnas)
+    distancias, elevaciones = columnas
+
+    if motor == 'numpy':
+        np = _importar_numpy()
+        distancias, elevaciones = np.asarray(distancias), np.asarray(elevaciones)
+        return distancias, elevaciones, *agrupar_por_direccion_np(distancias, elevaciones)
+
+    tramos_direccion = agrupar_por_direccion(_tramos_de_columnas(distancias, elevaciones))
+    return (distancias, elevaciones,
+            array('d', (t.distancia_m for t in tramos_direccion)),
+            array('d', (t.elevacion_m for t in tramos_direccion)))
+
+def error_perfil(distancias, elevaciones, tramos):
+    # Error (RMSE y máximo, en metros) del perfil de los tramos frente al perfil original,
+    # comparando la elevación acumulada en cada punto de la ruta
+    if not len(distancias) or not tramos:
+        return 0.0, 0.0
+
+    bordes_x, bordes_y = [0.0], [0.0]
+    for tramo in tramos:
+        bordes_x.append(bordes_x[-1] + tramo.distancia_m)
+        bordes_y.append(bordes_y[-1] + tramo.elevacion_m)
+
+    suma_cuadrados = maximo = 0.0
+    x = y = 0.0
+    i = 0
+    for d, e in zip(distancias, elevaciones):
+        x += d
+        y += e
+        while i < len(bordes_x) - 2 and bordes_x[i + 1] < x:
+            i += 1
+        x0, x1, y0, y1 = bordes_x[i], bordes_x[i + 1], bordes_y[i], bordes_y[i + 1]
+        estimada = y0 + (y1 - y0) * (x - x0) / (x1 - x0) if x1 > x0 else y1
+        error = abs(y - estimada)
+        suma_cuadrados += error * error
+        maximo = max(maximo, error)
+    return math.sqrt(suma_cuadrados / len(distancias)), maximo
+
+def error_perfil_np(distancias, elevaciones, tramos):
+    np = _importar_numpy()
+    if not len(distancias) or not tramos:
+        return 0.0, 0.0
+
+    bordes_x = np.concatenate(([0.0], np.cumsum([t.distancia_m for t in tramos])))
+    bordes_y = np.concatenate(([0.0], np.cumsum([t.elevacion_m for t in tramos])))
+    errores = np.abs(np.cumsum(elevaciones) - np.interp(np.cumsum(distancias), bordes_x, bordes_y))
+    return float(np.sqrt(np.mean(errores ** 2))), float(errores.max())
+
+def evaluar_umbrales(prefijo, parametros, motor='python'):
+    distancias, elevaciones, distancias_direccion, elevaciones_direccion = prefijo
+    umbral_elevacion, _, longitud_minima_tramo, _, _ = parametros
+
+    if motor == 'numpy':
+        tramos_mix = _umbrales_np(distancias_direccion, elevaciones_direccion, *parametros)
+        medir_error = error_perfil_np
+    else:
+        tramos_mix = _umbrales_python(_tramos_de_columnas(distancias_direccion, elevaciones_direccion), *parametros)
+        medir_error = error_perfil
+    tramos_mix = list(etapa_primer_tramo(tramos_mix, umbral_elevacion, longitud_minima_tramo))
+
+    error_rmse, error_maximo = medir_error(distancias, elevaciones, tramos_mix)
+    resultado = dict(zip(PARAMETROS, parametros))
+    resultado.update(tramos=len(tramos_mix), error_rmse_m=round(error_rmse, 2), error_max_m=round(error_maximo, 2))
+    return resultado
+
+def efecto_decimacion(gpx_file, tolerancia, parametros=None, motor='python'):
+    # Compara el análisis con y sin simplificar el perfil: segmentos que quedan, tramos finales
+    # y error (en metros) de cada resultado frente al perfil original
+    if parametros is None:
+        parametros = tuple(VALORES_POR_DEFECTO[nombre] for nombre in PARAMETROS)
+    umbral_elevacion, _, longitud_minima_tramo, _, _ = parametros
+    distancias, elevaciones = columnas_de_segmentos(gpx_file, motor)
+    medir_error = error_perfil_np if motor == 'numpy' else error_perfil
+
+    if motor == 'numpy':
+        decimados = len(decimar_perfil_np(distancias, elevaciones, tolerancia)[0])
+    else:
+        decimados = len(decimar_perfil(_tramos_de_columnas(distancias, elevaciones), tolerancia))
+
+    resultado = {'tolerancia_m': tolerancia, 'segmentos': len(distancias), 'segmentos_decimados': decimados}
+    for sufijo, decimar in (('sin_decimar', 0), ('decimado', tolerancia)):
+        tramos_mix = _tramos_mix_desde_columnas(distancias, elevaciones, motor, parametros, decimar=decimar)
+        tramos_mix = list(etapa_primer_tramo(tramos_mix, umbral_elevacion, longitud_minima_tramo))
+        error_rmse, error_maximo = medir_error(distancias, elevaciones, tramos_mix)
+        resultado[f'tramos_{sufijo}'] = len(tramos_mix)
+        resultado[f'error_rmse_{sufijo}_m'] = round(error_rmse, 2)
+        resultado[f'error_max_{sufijo}_m'] = round(error_maximo, 2)
+    return resultado
+
+def _evaluar_en_proceso(prefijo, motor, parametros):
+    return evaluar_umbrales(prefijo, parametros, motor)
+
+def barrido_umbrales(gpx_file, rejilla, motor='python', procesos=1, cache=None):
+    # rejilla: {nombre del parámetro: lista de valores}; los que falten toman el valor por defecto de la GUI.
+    # Devuelve, para cada combinación, los valores usados, el número de tramos y el error frente al perfil original.
+    desconocidos = set(rejilla) - set(PARAMETROS)
+    if desconocidos:
+        raise ValueError(f"Parámetros desconocidos: {', '.join(sorted(desconocidos))}")
+
+    valores = [list(rejilla.get(nombre, [VALORES_POR_DEFECTO[nombre]])) for nombre in PARAMETROS]
+    combinaciones = list(itertools.product(*valores))
+    prefijo = prefijo_comun(gpx_file, motor, cache)
+
+    if procesos == 1 or len(combinaciones) < 2:
+        return [evaluar_umbrales(prefijo, parametros, motor) for parametros in combinaciones]
+
+    from concurrent.futures import ProcessPoolExecutor
+    evaluar = functools.partial(_evaluar_en_proceso, prefijo, motor)
+    trabajadores = procesos or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        return list(pool.map(evaluar, combinaciones, chunksize=max(1, len(combinaciones) // (trabajadores * 4))))
+
+def elegir_umbrales(resultados, error_maximo):
+    # La combinación con menos tramos cuyo error RMSE no supera error_maximo (en metros)
+    validos = [r for r in resultados if r['error_rmse_m'] <= error_maximo]
+    if not validos:
+        return None
+    return min(validos, key=lambda r: (r['tramos'], r['error_rmse_m']))
+
+# --- Índice de la ruta: etapas por kilómetro --------------------------------
+# Sumas acumuladas de distancia, ascenso y descenso sobre los segmentos y los límites de cada racha
+# de la misma dirección. Con ellas, los totales de cualquier tramo [km_a, km_b] salen en O(log n) y
+# los tramos de una ventana se calculan sin volver a leer el GPX: las rachas que caen enteras dentro
+# se reutilizan y solo se vuelven a sumar las dos de los bordes, en el mismo orden que agrupar_por_direccion.
+
+class IndiceRuta:
+    def __init__(self, distancias, elevaciones, distancias_direccion, elevaciones_direccion, motor='python'):
+        self.motor = motor
+        self.distancias = distancias
+        self.elevaciones = elevaciones
+        self.distancias_direccion = distancias_direccion
+        self.elevaciones_direccion = elevaciones_direccion
+
+        if motor == 'numpy':
+            np = _importar_numpy()
+            subida = elevaciones >= 0
+            self.distancia_acumulada = array('d', np.concatenate(([0.0], np.cumsum(distancias))).tobytes())
+            self.ascenso_acumulado = array('d', np.concatenate(([0.0], np.cumsum(np.maximum(elevaciones, 0.0)))).tobytes())
+            self.descenso_acumulado = array('d', np.concatenate(([0.0], np.cumsum(np.maximum(-elevaciones, 0.0)))).tobytes())
+            self.inicios_direccion = array('q', np.flatnonzero(np.concatenate(([True], subida[1:] != subida[:-1])))
+                                           .astype(np.int64).tobytes())
+            return
+
+        self.distancia_acumulada = array('d', itertools.accumulate(distancias, initial=0.0))
+        self.ascenso_acumulado = array('d', itertools.accumulate((e if e > 0 else 0.0 for e in elevaciones), initial=0.0))
+        self.descenso_acumulado = array('d', itertools.accumulate((-e if e < 0 else 0.0 for e in elevaciones), initial=0.0))
+
+        # Primer segmento de cada racha de la misma dirección (la misma regla que etapa_por_direccion)
+        self.inicios_direccion = array('q', (i for i in range(len(elevaciones))
+                                             if i == 0 or (elevaciones[i] >= 0) != (elevaciones[i - 1] >= 0)))
+
+    def __len__(self):
+        return len(self.distancias)
+
+    @property
+    def distancia_total_km(self):
+        return self.distancia_acumulada[-1] / 1000
+
+    def _punto(self, km):
+        # Primer punto de la ruta que está en el kilómetro km o después
+        return min(bisect.bisect_left(self.distancia_acumulada, km * 1000), len(self.distancias))
+
+    def _fin_de_racha(self, k):
+        return self.inicios_direccion[k + 1] if k + 1 < len(self.inicios_direccion) else len(self.distancias)
+
+    def totales(self, km_a, km_b):
+        # Distancia, ascenso y descenso entre los puntos de los kilómetros km_a y km_b
+        i, j = self._punto(km_a), max(self._punto(km_b), self._punto(km_a))
+        return {
+            'desde_km': round(self.distancia_acumulada[i] / 1000, 3),
+            'hasta_km': round(self.distancia_acumulada[j] / 1000, 3),
+            'segmentos': j - i,
+            'distancia_m': round(self.distancia_acumulada[j] - self.distancia_acumulada[i], 2),
+            'ascenso_m': round(self.ascenso_acumulado[j] - self.ascenso_acumulado[i], 2),
+            'descenso_m': round(self.descenso_acumulado[j] - self.descenso_acumulado[i], 2),
+        }
+
+    @staticmethod
+    def _suma_en_orden(valores, inicio, fin):
+        # De izquierda a derecha, como _juntar. sum() no vale: desde Python 3.12 compensa el redondeo
+        # y la racha podría no sumar lo mismo que al agrupar la ventana directamente
+        total = 0.0
+        for valor in valores[inicio:fin]:
+            total += valor
+        return total
+
+    def _por_direccion(self, i, j):
+        # Columnas de agrupar_por_direccion sobre los segmentos [i, j)
+        distancias, elevaciones = array('d'), array('d')
+        if i >= j:
+            return distancias, elevaciones
+        primera = bisect.bisect_right(self.inicios_direccion, i) - 1
+        ultima = bisect.bisect_right(self.inicios_direccion, j - 1) - 1
+        for k in range(primera, ultima + 1):
+            inicio, fin = self.inicios_direccion[k], self._fin_de_racha(k)
+            if i <= inicio and fin <= j:
+                distancias.append(self.distancias_direccion[k])
+                elevaciones.append(self.elevaciones_direccion[k])
+            else:
+                inicio, fin = max(inicio, i), min(fin, j)
+                distancias.append(self._suma_en_orden(self.distancias, inicio, fin))
+                elevaciones.append(self._suma_en_orden(self.elevaciones, inicio, fin))
+        return distancias, elevaciones
+
+    def tramos(self, km_a, km_b, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+               longitud_horizontal_minima, elevacion_minima_asociada):
+        # Los tramos finales de la parte de la ruta entre los kilómetros km_a y km_b
+        parametros = (umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+                      longitud_horizontal_minima, elevacion_minima_asociada)
+        i, j = self._punto(km_a), self._punto(km_b)
+        distancias, elevaciones = self._por_direccion(i, j)
+        if self.motor == 'numpy':
+            np = _importar_numpy()
+            tramos_mix = _umbrales_np(np.asarray(distancias), np.asarray(elevaciones), *parametros)
+        else:
+            tramos_mix = _umbrales_python(_tramos_de_columnas(distancias, elevaciones), *parametros)
+        tramos_mix = list(etapa_primer_tramo(tramos_mix, umbral_elevacion, longitud_minima_tramo))
+        return calcular_pendiente_y_enumerar(tramos_mix)
+
+    def etapas(self, cortes_km, *parametros):
+        # Divide la ruta por los kilómetros de cortes_km (sin contar el inicio ni el final).
+        # Devuelve los (nombre de hoja, tramos) de cada etapa, listos para escribir_calculador
+        limites = [0.0, *sorted(km for km in cortes_km if 0 < km < self.distancia_total_km), self.distancia_total_km]
+        hojas = []
+        for n, (km_a, km_b) in enumerate(zip(limites, limites[1:]), 1):
+            hojas.append((f"Etapa {n} ({round(km_a, 1):g}-{round(km_b, 1):g} km)",
+                          self.tramos(km_a, km_b, *parametros)))
+        return hojas
+
+def indexar_ruta(gpx_file, motor='python', cache=None):
+    # Un IndiceRuta de la ruta, a partir de los mismos segmentos (y caché) que barrido_umbrales
+    return IndiceRuta(*prefijo_comun(gpx_file, motor, cache), motor=motor)
+
+def tramos_por_etapas(gpx_file, cortes_km, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+         longitud_horizontal_minima, elevacion_minima_asociada, motor='python', cache=None, medidas=None):
+    # Devuelve [(nombre de hoja, tramos)] con una hoja por etapa, leyendo el GPX una sola vez
+    if motor not in MOTORES:
+        raise ValueError(f"Motor desconocido '{motor}'. Opciones: {', '.join(MOTORES)}")
+    with etapa(medidas, 'indexar_ruta') as e:
+        indice = indexar_ruta(gpx_file, 'numpy' if motor == 'numpy' else 'python', cache)
+        e.salida = len(indice)
+    with etapa(medidas, 'tramos_por_etapas', len(cortes_km) + 1) as e:
+        hojas = indice.etapas(cortes_km, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+                              longitud_horizontal_minima, elevacion_minima_asociada)
+        e.salida = sum(len(tramos) for _, tramos in hojas)
+    return hojas
+
 def rellenar_plantilla(ws, tramos_finales, seccion, preparacion, descanso, cada):
+    from xlwings.constants import AutoFillType
     ws.range(f"C4").value = seccion
     ws.range(f"E4").value = preparacion
     ws.range(f"C6").value = descanso
@@ -233,99 +1149,420 @@ def rellenar_plantilla(ws, tramos_finales, seccion, preparacion, descanso, cada)
         ws.range(f"E{fila}").value = abs(desnivel)
 
 
+def remove_accents(s: str) -> str:
+    import unicodedata
+    """Elimina acentos de una cadena."""
+    return ''.join(
+        c for c in unicodedata.normalize('NFD', s)
+        if unicodedata.category(c) != 'Mn'
+    )
+
+def _listar_zip(file):
+    # Un zip que no se puede abrir se devuelve tal cual, para que su error salga con los del resto
+    try:
+        return entradas.listar_zip(file)
+    except (OSError, zipfile.BadZipFile):
+        return [file]
+
+def listar_gpx(carpeta):
+    # Los .gpx de la carpeta (también .gpx.gz, .gpx.bz2 y .gpx.xz), los .gxb convertidos (convertir_gpx)
+    # y los .gpx de cada .zip, que son una ruta cada uno. Si una ruta está en los dos formatos, se usa el
+    # .gxb, salvo que el .gpx se haya modificado después de convertirlo. carpeta también puede ser un zip
+    if entradas.es_zip(carpeta):
+        return _listar_zip(pathlib.Path(carpeta))
+    rutas = {}
+    miembros = []
+    for file in pathlib.Path(carpeta).iterdir():
+        if not file.is_file():
+            continue
+        if entradas.es_zip(file):
+            miembros.extend(_listar_zip(file))
+            continue
+        if not entradas.es_gpx(file) and not es_puntos_binarios(file):
+            continue
+        nombre = entradas.nombre_de_ruta(file)
+        otra = rutas.get(nombre)
+        if otra is None:
+            rutas[nombre] = file
+            continue
+        if es_puntos_binarios(file) != es_puntos_binarios(otra):
+            gpx, binario = (otra, file) if es_puntos_binarios(file) else (file, otra)
+            rutas[nombre] = binario if binario.stat().st_mtime >= gpx.stat().st_mtime else gpx
+        else:
+            # El mismo GPX con y sin comprimir: el más reciente
+            rutas[nombre] = max(file, otra, key=lambda f: (f.stat().st_mtime, f.name))
+    return list(rutas.values()) + miembros
+
+def convertir_carpeta(carpeta):
+    # Convierte a .gxb los GPX de la carpeta que no lo estén ya (o que hayan cambiado desde entonces).
+    # Los de dentro de un zip se siguen leyendo del zip
+    return [convertir_gpx(file) for file in listar_gpx(carpeta)
+            if not es_puntos_binarios(file) and entradas.es_gpx(file) and not isinstance(file, entradas.MiembroZip)]
+
+def _analizar_archivo(file, parametros, motor, cache, decimar=0, memoria=None, aviso=None, segmentos=False):
+    # memoria: None para no medir; True/False para medir con o sin pico de memoria.
+    # aviso: el de Medidas, solo cuando se analiza en el mismo proceso.
+    # Devuelve los tramos y las etapas medidas, que desde otro proceso hay que devolver al principal
+    medidas = None if memoria is None else Medidas(memoria, aviso)
+    if medidas is not None:
+        medidas.archivo = file.name
+    tramos = get_tramos_finales(file, *parametros, motor=motor, cache=cache, medidas=medidas, decimar=decimar,
+                                segmentos=segmentos)
+    return tramos, [] if medidas is None else medidas.etapas
+
+def nombre_de_hoja(file):
+    return remove_accents(entradas.nombre_de_ruta(file).lower()).title()
+
+def analizar_archivos(archivos, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+         longitud_horizontal_minima, elevacion_minima_asociada, motor='python', procesos=1, cache=None,
+         medidas=None, decimar=0, segmentos=False):
+    # Analiza los GPX de la lista, en paralelo si procesos != 1.
+    # Con segmentos, los procesos se reparten los archivos, no los segmentos de cada uno
+    # Devuelve los (archivo, tramos) y los (nombre de archivo, error) de los que fallen, sin que un
+    # archivo con errores pare el resto. Si el aviso de medidas lanza Cancelado, se para todo.
+    parametros = (umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+                  longitud_horizontal_minima, elevacion_minima_asociada)
+    memoria = None if medidas is None else medidas.memoria
+
+    tramos_de_ficheros = []
+    errores = []
+    if procesos == 1 or len(archivos) < 2:
+        aviso = None if medidas is None else medidas.aviso
+        for i, file in enumerate(archivos, 1):
+            if medidas is not None:
+                medidas.avisar(f"Archivo {i} de {len(archivos)}: {file.name}")
+            try:
+                tramos, etapas = _analizar_archivo(file, parametros, motor, cache, decimar, memoria, aviso, segmentos)
+                tramos_de_ficheros.append((file, tramos))
+                if medidas is not None:
+                    medidas.anadir(etapas, file.name)
+            except Cancelado:
+                raise
+            except Exception as e:
+                errores.append((file.name, str(e) or type(e).__name__))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            futuros = {pool.submit(_analizar_archivo, file, parametros, motor, cache, decimar, memoria, None, segmentos): file
+                       for file in archivos}
+            for i, futuro in enumerate(as_completed(futuros), 1):
+                file = futuros[futuro]
+                try:
+                    tramos, etapas = futuro.result()
+                    tramos_de_ficheros.append((file, tramos))
+                    if medidas is not None:
+                        medidas.anadir(etapas, file.name)
+                except Exception as e:
+                    errores.append((file.name, str(e) or type(e).__name__))
+                if medidas is not None:
+                    try:
+                        medidas.avisar(f"Analizados {i} de {len(archivos)}: {file.name}")
+                    except Cancelado:
+                        # Los archivos que aún no han empezado no se analizan
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        raise
+    return tramos_de_ficheros, errores
+
+def analizar_carpeta(carpeta, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+         longitud_horizontal_minima, elevacion_minima_asociada, motor='python', procesos=1, cache=None,
+         medidas=None, decimar=0, segmentos=False):
+    # Analiza todos los GPX de la carpeta (ver analizar_archivos).
+    # Devuelve los (nombre de hoja, tramos) ordenados por nombre y los (archivo, error) de los que fallen
+    tramos_de_ficheros, errores = analizar_archivos(listar_gpx(carpeta), umbral_elevacion, pendiente_maxima_valida,
+                                                    longitud_minima_tramo, longitud_horizontal_minima,
+                                                    elevacion_minima_asociada, motor=motor, procesos=procesos,
+                                                    cache=cache, medidas=medidas, decimar=decimar,
+                                                    segmentos=segmentos)
+    processed = [
+        (nombre_de_hoja(file), tramos)
+        for file, tramos in tramos_de_ficheros
+    ]
+    # Ordenar por el nombre (primer elemento de la tupla)
+    return sorted(processed, key=lambda x: x[0]), sorted(errores)
+
+def escribir_calculador(gpx_output, tramos_de_ficheros, seccion, preparacion, descanso, cada, escritor='excel',
+                        medidas=None):
+    # Genera el calculador con una hoja por cada (nombre de hoja, tramos).
+    # Devuelve los nombres que han recibido las hojas
+    import escritor_xlsx
+    plantilla = resource_path('plantilla.xlsx')
+    if escritor == 'xlsx':
+        with etapa(medidas, 'escribir_xlsx', len(tramos_de_ficheros)):
+            return escritor_xlsx.generar_calculador(plantilla, gpx_output, tramos_de_ficheros,
+                                                    seccion, preparacion, descanso, cada)
+
+    # Con Excel, copiar la hoja y rellenarla celda a celda por cada ruta es lo que más tarda. Las hojas
+    # se arman en memoria clonando la plantilla ya analizada (escritor_xlsx) y el libro se escribe de una
+    # vez; Excel solo lo abre y lo guarda, para que quede calculado como si lo hubiese rellenado él
+    import xlwings as xw
+    with etapa(medidas, 'escribir_excel', len(tramos_de_ficheros)):
+        nombres = escritor_xlsx.generar_calculador(plantilla, gpx_output, tramos_de_ficheros,
+                                                   seccion, preparacion, descanso, cada)
+        app = xw.App(visible=False)
+        try:
+            wb = app.books.open(os.path.abspath(gpx_output))
+            wb.sheets[0].activate()
+            wb.save()
+            wb.close()
+        finally:
+            app.quit()  # Cierra Excel por completo
+    return nombres
+
+# --- Modo incremental -------------------------------------------------------
+# Junto al calculador de una carpeta se guarda un manifiesto (<salida>.manifiesto.json) con el tamaño,
+# la fecha, la huella, la hoja y los tramos de cada GPX. Con él, la siguiente ejecución solo analiza
+# los archivos nuevos o modificados y solo reescribe, añade o quita sus hojas. El calculador se genera
+# entero si no hay manifiesto, si cambian los valores de la ejecución o si el archivo se ha modificado
+# por otro lado (por ejemplo, al guardarlo desde Excel). Con el escritor 'excel' también se genera
+# entero cuando algo cambia, pero sin volver a analizar los archivos que no han cambiado.
+
+VERSION_MANIFIESTO = 1
+
+def ruta_manifiesto(gpx_output):
+    return pathlib.Path(f"{gpx_output}.manifiesto.json")
+
+def _leer_manifiesto(gpx_output, opciones):
+    try:
+        with open(ruta_manifiesto(gpx_output), 'r', encoding='utf-8') as f:
+            manifiesto = json.load(f)
+        firma_salida = entradas.firma(gpx_output)
+    except (OSError, ValueError):
+        return None
+    if (manifiesto.get('version') != VERSION_MANIFIESTO or manifiesto.get('opciones') != opciones
+            or manifiesto.get('salida') != firma_salida):
+        return None
+    return manifiesto
+
+def _guardar_manifiesto(gpx_output, opciones, archivos, errores):
+    manifiesto = {'version': VERSION_MANIFIESTO, 'opciones': opciones, 'salida': entradas.firma(gpx_output),
+                  'archivos': archivos, 'errores': errores}
+    with escribir_atomico(ruta_manifiesto(gpx_output), 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, ensure_ascii=False)
+
+def actualizar_carpeta(carpeta, gpx_output, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+         longitud_horizontal_minima, elevacion_minima_asociada,
+         seccion, preparacion, descanso, cada, escritor='xlsx', motor='python', procesos=1, cache=None,
+         medidas=None, decimar=0, segmentos=False):
+    # Versión incremental de main para una carpeta.
+    # Devuelve un resumen de lo hecho ({'completo', 'analizados', 'anadidas', 'reescritas', 'quitadas'})
+    # y los (archivo, error) de los GPX que no se han podido procesar. Un archivo con errores no se
+    # vuelve a intentar hasta que cambia.
+    parametros = (umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+                  longitud_horizontal_minima, elevacion_minima_asociada)
+    opciones = {'parametros': list(parametros), 'seccion': seccion, 'preparacion': preparacion,
+                'descanso': descanso, 'cada': cada, 'decimar': decimar, 'escritor': escritor}
+    if segmentos:
+        # Solo se añade cuando se usa, para que los manifiestos anteriores sigan valiendo
+        opciones['segmentos'] = True
+    manifiesto = _leer_manifiesto(gpx_output, opciones)
+    completo = manifiesto is None
+    anteriores = {} if completo else manifiesto['archivos']
+    errores_anteriores = {} if completo else manifiesto['errores']
+
+    actuales, errores_actuales, pendientes, huellas = {}, {}, [], {}
+    for file in listar_gpx(carpeta):
+        firma = entradas.firma(file)
+        error = errores_anteriores.get(file.name)
+        if error is not None and error['firma'] == firma:
+            errores_actuales[file.name] = error
+            continue
+        entrada = anteriores.get(file.name)
+        if entrada is not None and entrada['firma'] != firma:
+            huella = huella_archivo(file)
+            # Si solo ha cambiado la fecha, el análisis sigue valiendo
+            entrada = {**entrada, 'firma': firma} if huella == entrada['huella'] else None
+            huellas[file.name] = huella
+        if entrada is None:
+            pendientes.append((file, firma))
+        else:
+            actuales[file.name] = entrada
+
+    analizados, errores = analizar_archivos([file for file, _ in pendientes], *parametros, motor=motor,
+                                            procesos=procesos, cache=cache, medidas=medidas, decimar=decimar,
+                                            segmentos=segmentos)
+    firmas = {file.name: firma for file, firma in pendientes}
+    for nombre, error in errores:
+        errores_actuales[nombre] = {'firma': firmas[nombre], 'error': error}
+
+    reemplazar, anadir = [], []
+    for file, tramos in analizados:
+        entrada = {'firma': firmas[file.name], 'huella': huellas.get(file.name) or huella_archivo(file),
+                   'hoja': None, 'tramos': [dict(tramo) for tramo in tramos]}
+        anterior = anteriores.get(file.name)
+        if anterior is not None:
+            entrada['hoja'] = anterior['hoja']
+            reemplazar.append((anterior['hoja'], tramos))
+        else:
+            anadir.append((file.name, nombre_de_hoja(file), tramos))
+        actuales[file.name] = entrada
+    quitar = [entrada['hoja'] for nombre, entrada in anteriores.items() if nombre not in actuales]
+
+    resumen = {'completo': completo, 'analizados': len(pendientes), 'anadidas': [], 'reescritas': [], 'quitadas': []}
+    if not actuales:
+        raise ValueError("No se ha podido procesar ningún archivo GPX:\n" +
+                         "\n".join(f"{nombre}: {e['error']}" for nombre, e in sorted(errores_actuales.items())))
+
+    if completo or (escritor == 'excel' and (reemplazar or anadir or quitar)):
+        archivos = sorted(actuales, key=lambda nombre: nombre_de_hoja(nombre))
+        hojas = [(nombre_de_hoja(nombre), [Tramo.desde_dict(t) for t in actuales[nombre]['tramos']])
+                 for nombre in archivos]
+        nombres = escribir_calculador(gpx_output, hojas, seccion, preparacion, descanso, cada, escritor, medidas)
+        for nombre, hoja in zip(archivos, nombres):
+            actuales[nombre]['hoja'] = hoja
+        resumen.update(completo=True, anadidas=nombres)
+    elif reemplazar or anadir or quitar:
+        import escritor_xlsx
+        with etapa(medidas, 'actualizar_xlsx', len(reemplazar) + len(anadir) + len(quitar)):
+            nombres = escritor_xlsx.actualizar_calculador(resource_path('plantilla.xlsx'), gpx_output, reemplazar,
+                                                          [(hoja, tramos) for _, hoja, tramos in anadir], quitar,
+                                                          seccion, preparacion, descanso, cada)
+        for (nombre, _, _), hoja in zip(anadir, nombres):
+            actuales[nombre]['hoja'] = hoja
+        resumen.update(anadidas=nombres, reescritas=[hoja for hoja, _ in reemplazar], quitadas=quitar)
+
+    if completo or pendientes or actuales != anteriores or errores_actuales != errores_anteriores:
+        _guardar_manifiesto(gpx_output, opciones, actuales, errores_actuales)
+    return resumen, sorted((nombre, e['error']) for nombre, e in errores_actuales.items())
+
+def vigilar_carpeta(carpeta, gpx_output, *argumentos, intervalo=5.0, parar=None, al_actualizar=None, **opciones):
+    # Repite actualizar_carpeta cada `intervalo` segundos hasta que se active `parar` (un threading.Event).
+    # al_actualizar(resumen, errores) se llama cada vez que cambia algo; si la actualización falla
+    # (por ejemplo, porque el calculador está abierto), resumen es None y se vuelve a intentar en la siguiente
+    import threading
+    parar = parar or threading.Event()
+    while True:
+        try:
+            resumen, errores = actualizar_carpeta(carpeta, gpx_output, *argumentos, **opciones)
+            if al_actualizar is not None and (resumen['completo'] or resumen['analizados'] or resumen['quitadas']):
+                al_actualizar(resumen, errores)
+        except Exception as e:
+            if al_actualizar is not None:
+                al_actualizar(None, [(os.path.basename(gpx_output), str(e) or type(e).__name__)])
+        if parar.wait(intervalo):
+            return
+
 def main(gpx_file, gpx_output, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
          longitud_horizontal_minima, elevacion_minima_asociada,
-         seccion, preparacion, descanso, cada):
+         seccion, preparacion, descanso, cada, escritor='excel', motor='python', procesos=1, cache=None,
+         medidas=None, decimar=0, incremental=False, etapas=None, segmentos=None):
     # USO
+    # escritor: 'excel' rellena la plantilla con Excel (xlwings); 'xlsx' edita el archivo directamente, sin Excel
+    # procesos: número de procesos para analizar una carpeta o, con segmentos, los segmentos de un archivo (None = todos los núcleos)
+    # cache: CacheTramos con los análisis ya hechos (None = sin caché)
+    # medidas: Medidas (medidas.py) en el que anotar el tiempo de cada etapa (None = sin medir)
+    # decimar: tolerancia vertical (en metros) para simplificar el perfil antes de agrupar (0 = no simplificar)
+    # incremental: con una carpeta, actualiza el calculador existente (ver actualizar_carpeta)
+    # etapas: con un archivo, kilómetros en los que se corta la ruta; se genera una hoja por etapa
+    # segmentos: una de POLITICAS_SEGMENTOS para agrupar cada trk/trkseg por separado (None = como una sola ruta).
+    # 'pista' y 'segmento' generan una hoja por pista o segmento y solo valen con un archivo
+    # Devuelve la lista de (archivo, error) de los GPX de la carpeta que no se han podido procesar
+    if escritor not in ('excel', 'xlsx'):
+        raise ValueError(f"Escritor desconocido '{escritor}'. Opciones: excel, xlsx")
+    if escritor == 'excel':
+        import xlwings as xw
+    else:
+        import escritor_xlsx
     path_gpx = pathlib.Path(gpx_file)
-
-    if path_gpx.is_file():
+    errores = []
+    # Un zip se trata como una carpeta: una hoja por cada GPX que contiene
+    es_carpeta = path_gpx.is_dir() or (path_gpx.is_file() and entradas.es_zip(path_gpx))
+    if segmentos is not None and segmentos not in POLITICAS_SEGMENTOS:
+        raise ValueError(f"Política de segmentos desconocida '{segmentos}'. Opciones: {', '.join(POLITICAS_SEGMENTOS)}")
+    if segmentos and etapas:
+        raise ValueError("Las etapas no se pueden combinar con el análisis por segmentos")
+    if segmentos not in (None, 'unir') and (es_carpeta or not path_gpx.is_file()):
+        raise ValueError(f"Con una carpeta solo se pueden unir los segmentos, no separarlos por '{segmentos}'")
+
+    if etapas:
+        if not path_gpx.is_file() or es_carpeta:
+            raise ValueError("Las etapas solo se pueden calcular con un archivo GPX, no con una carpeta")
+        if decimar:
+            raise ValueError("Las etapas no admiten simplificar el perfil (decimar)")
+        hojas = tramos_por_etapas(gpx_file, etapas, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+                                  longitud_horizontal_minima, elevacion_minima_asociada, motor=motor, cache=cache,
+                                  medidas=medidas)
+        escribir_calculador(gpx_output, hojas, seccion, preparacion, descanso, cada, escritor, medidas)
+    elif segmentos in ('pista', 'segmento'):
+        hojas = tramos_por_segmentos(gpx_file, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
+                                     longitud_horizontal_minima, elevacion_minima_asociada, politica=segmentos,
+                                     motor=motor, procesos=procesos, medidas=medidas, decimar=decimar)
+        escribir_calculador(gpx_output, hojas, seccion, preparacion, descanso, cada, escritor, medidas)
+    elif path_gpx.is_file() and not es_carpeta:
 
         tramos_finales = get_tramos_finales(gpx_file, umbral_elevacion, pendiente_maxima_valida, longitud_minima_tramo,
-         longitud_horizontal_minima, elevacion_minima_asociada)
+         longitud_horizontal_minima, elevacion_minima_asociada, motor=motor, cache=cache, medidas=medidas,
+         decimar=decimar, segmentos=bool(segmentos), procesos=procesos)
 
-        app = xw.App(visible=False)
-
-        plantilla = resource_path('plantilla.xlsx')
-        wb = app.books.open(plantilla)
-
-        ws = wb.sheets[0]  # Primera hoja
-
-        rellenar_plantilla(ws, tramos_finales, seccion, preparacion, descanso, cada)
-
-        wb.save(gpx_output)
-        wb.close()
-        app.quit()  # Cierra Excel por completo
-    elif path_gpx.is_dir():
-        tramos_de_ficheros  = []
-        for file in path_gpx.iterdir():
-            if not file.is_file() or file.suffix.upper() != ".GPX":
-                continue
-            tramos_finales = get_tramos_finales(file, umbral_elevacion, pendiente_maxima_valida,
-                                                longitud_minima_tramo,
-                                                longitud_horizontal_minima, elevacion_minima_asociada)
-            tramos_de_ficheros.append((file.stem,tramos_finales))
-
-        plantilla = resource_path('plantilla.xlsx')
-        app = xw.App(visible=False)
-
-        wb = app.books.open(plantilla)
-        ws = wb.sheets[0]
+        if escritor == 'xlsx':
+            with etapa(medidas, 'escribir_xlsx', len(tramos_finales)):
+                escritor_xlsx.generar_calculador(resource_path('plantilla.xlsx'), gpx_output, [(None, tramos_finales)],
+                                                 seccion, preparacion, descanso, cada)
+            return errores
 
-        def remove_accents(s: str) -> str:
-            import unicodedata
-            """Elimina acentos de una cadena."""
-            return ''.join(
-                c for c in unicodedata.normalize('NFD', s)
-                if unicodedata.category(c) != 'Mn'
-            )
+        with etapa(medidas, 'escribir_excel', len(tramos_finales)):
+            app = xw.App(visible=False)
 
-        processed = [
-            (remove_accents(name.lower()).title(), path)
-            for name, path in tramos_de_ficheros
-        ]
-        # Ordenar por el nombre (primer elemento de la tupla)
-        tramos_de_ficheros = sorted(processed, key=lambda x: x[0])
+            plantilla = resource_path('plantilla.xlsx')
+            wb = app.books.open(plantilla)
 
-        for i in range(len(tramos_de_ficheros)-1):
-            # copia ws y la coloca al final
-            ws.copy(after=wb.sheets[-1])
+            ws = wb.sheets[0]  # Primera hoja
 
-        for i, elem in enumerate(tramos_de_ficheros):
-            ws = wb.sheets[i]
-            ws.name = elem[0]
-            rellenar_plantilla(ws, elem[1], seccion, preparacion, descanso, cada)
+            rellenar_plantilla(ws, tramos_finales, seccion, preparacion, descanso, cada)
 
-        wb.sheets[0].activate()
+            wb.save(gpx_output)
+            wb.close()
+            app.quit()  # Cierra Excel por completo
+    elif es_carpeta and incremental:
+        return actualizar_carpeta(path_gpx, gpx_output, umbral_elevacion, pendiente_maxima_valida,
+                                  longitud_minima_tramo, longitud_horizontal_minima, elevacion_minima_asociada,
+                                  seccion, preparacion, descanso, cada, escritor=escritor, motor=motor,
+                                  procesos=procesos, cache=cache, medidas=medidas, decimar=decimar,
+                                  segmentos=bool(segmentos))[1]
+    elif es_carpeta:
+        tramos_de_ficheros, errores = analizar_carpeta(path_gpx, umbral_elevacion, pendiente_maxima_valida,
+                                                       longitud_minima_tramo, longitud_horizontal_minima,
+                                                       elevacion_minima_asociada, motor=motor, procesos=procesos,
+                                                       cache=cache, medidas=medidas, decimar=decimar,
+                                                       segmentos=bool(segmentos))
+        if errores and not tramos_de_ficheros:
+            raise ValueError("No se ha podido procesar ningún archivo GPX:\n" +
+                             "\n".join(f"{nombre}: {error}" for nombre, error in errores))
 
-        wb.save(gpx_output)
-        wb.close()
+        escribir_calculador(gpx_output, tramos_de_ficheros, seccion, preparacion, descanso, cada, escritor, medidas)
 
-        app.quit()  # Cierra Excel por completo
+    return errores
 
 
 def seleccionar_archivo(entry_widget, filetypes):
+    import tkinter as tk
+    from tkinter import filedialog
     archivo = filedialog.askopenfilename(filetypes=filetypes)
     if archivo:
         entry_widget.delete(0, tk.END)
         entry_widget.insert(0, archivo)
 
 def seleccionar_archivo_salida(entry_widget, filetypes):
+    import tkinter as tk
+    from tkinter import filedialog
     archivo = filedialog.asksaveasfilename(filetypes=filetypes)
     if archivo:
         entry_widget.delete(0, tk.END)
         entry_widget.insert(0, archivo)
 
 def seleccionar_carpeta(entry_widget):
+    import tkinter as tk
+    from tkinter import filedialog
     carpeta = filedialog.askdirectory()
     if carpeta:
         entry_widget.delete(0, tk.END)
         entry_widget.insert(0, carpeta)
+
 def autocompletar(entry_widget1, entry_widget2):
+    import tkinter as tk
     if entry_widget1.get():
         path = pathlib.Path(entry_widget1.get())
         if not path.exists() or path.is_file():
-            path = path.with_suffix(".xlsx")
+            path = entradas.sin_compresion(path).with_suffix(".xlsx")
 
         else:
             path = path / "CalculadorDeTramos.xlsx"
@@ -338,10 +1575,16 @@ def autocompletar(entry_widget1, entry_widget2):
 
 
 def crear_gui():
+    import queue
+    import threading
+    import tkinter as tk
+    from tkinter import messagebox
+    from tkinter.ttk import Combobox
+
     root = tk.Tk()
     root.title("Auto Calculador de Tramos GPX")
-    root.geometry("570x385")
-    root.minsize(570, 385)
+    root.geometry("570x415")
+    root.minsize(570, 415)
     root.resizable(True, False)
 
     root.columnconfigure(0, weight=1)
@@ -355,7 +1598,7 @@ def crear_gui():
     tk.Label(frame_archivos, text="Archivo GPX de entrada:").grid(row=0, column=0, sticky="w", padx=(0,5))
     entry_gpx = tk.Entry(frame_archivos)
     entry_gpx.grid(row=0, column=1, sticky="ew")
-    tk.Button(frame_archivos, text="Seleccionar", command=lambda: seleccionar_archivo(entry_gpx, [("GPX files","*.gpx")])).grid(row=0, column=2, padx=(5,0))
+    tk.Button(frame_archivos, text="Seleccionar", command=lambda: seleccionar_archivo(entry_gpx, [("GPX files","*.gpx *.gxb *.gpx.gz *.gpx.bz2 *.gpx.xz *.zip")])).grid(row=0, column=2, padx=(5,0))
     tk.Button(frame_archivos, text="Seleccionar Carpeta", command=lambda: seleccionar_carpeta(entry_gpx, )).grid(row=0, column=3, padx=(5,0))
 
     tk.Label(frame_archivos, text="Archivo XLSX de salida:").grid(row=1, column=0, sticky="w", padx=(0,5), pady=(5,0))
@@ -417,15 +1660,16 @@ def crear_gui():
         if not gpx_path:
             messagebox.showerror("Error", "Por favor, seleccione el archivo GPX de entrada.")
             return
-        if not gpx_path.lower().endswith('.gpx') or not os.path.isfile(gpx_path):
+        if not gpx_path.lower().endswith((*entradas.EXTENSIONES, EXTENSION_BINARIA)) or not os.path.isfile(gpx_path):
             path = pathlib.Path(gpx_path)
             if not path.is_dir():
-                messagebox.showerror("Error", "El archivo de entrada debe existir y tener extensión .gpx")
+                messagebox.showerror("Error", "El archivo de entrada debe existir y tener extensión .gpx, .gxb, "
+                                              ".gpx.gz, .gpx.bz2, .gpx.xz o .zip")
                 return
         if not xlsx_path:
             path = pathlib.Path(gpx_path)
             if not path.exists() or path.is_file():
-                path = path.with_suffix(".xlsx")
+                path = entradas.sin_compresion(path).with_suffix(".xlsx")
 
             else:
                 path = path / "CalculadorDeTramos.xlsx"
@@ -446,14 +1690,14 @@ def crear_gui():
             messagebox.showerror("Error", f"No se puede escribir en '{xlsx_path}': {e}")
             return
 
-        descanso_val = int(entry_descanso.get())
-        cada_val = int(entry_cada.get())
-        if cada_val <= 0:
-            cada_val = 1
-
-        # Ejecutar lógica principal
+        # Ejecutar lógica principal en un hilo aparte para que la ventana siga respondiendo.
+        # El hilo no toca la interfaz: manda el progreso y el resultado por la cola
         try:
-            main(
+            descanso_val = int(entry_descanso.get())
+            cada_val = int(entry_cada.get())
+            if cada_val <= 0:
+                cada_val = 1
+            parametros = dict(
                 gpx_file=gpx_path,
                 gpx_output=xlsx_path,
                 umbral_elevacion=int(entry_umbral.get()),
@@ -466,11 +1710,85 @@ def crear_gui():
                 descanso=descanso_val,
                 cada=cada_val,
             )
+        except ValueError as e:
+            messagebox.showerror("Error", f"Los valores numéricos no son válidos:\n{e}")
+            return
+
+        cancelar.clear()
+        boton_ejecutar.config(state="disabled")
+        boton_cancelar.config(state="normal")
+        estado.set("Analizando...")
+        threading.Thread(target=trabajo, args=(parametros,), daemon=True).start()
+        root.after(100, revisar_cola, gpx_path, xlsx_path)
+
+    def aviso(texto):
+        # Se llama desde el hilo de trabajo al empezar cada etapa y cada archivo
+        if cancelar.is_set():
+            raise Cancelado()
+        cola.put(('progreso', texto))
+
+    def trabajo(parametros):
+        # Excel (xlwings) usa COM en Windows, que hay que inicializar en cada hilo
+        pythoncom = None
+        if sys.platform == 'win32':
+            try:
+                import pythoncom
+                pythoncom.CoInitialize()
+            except ImportError:
+                pythoncom = None
+        medidas = Medidas(aviso=aviso)
+        try:
+            errores = main(**parametros, cache=CacheTramos(), medidas=medidas)
+            cola.put(('fin', errores, medidas.resumen()))
+        except Cancelado:
+            cola.put(('cancelado',))
+        except Exception as e:
+            cola.put(('error', e))
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+
+    def revisar_cola(gpx_path, xlsx_path):
+        mensaje = None
+        try:
+            while True:
+                mensaje = cola.get_nowait()
+                if mensaje[0] == 'progreso':
+                    estado.set(mensaje[1])
+                else:
+                    break
+        except queue.Empty:
+            pass
+        if mensaje is None or mensaje[0] == 'progreso':
+            root.after(100, revisar_cola, gpx_path, xlsx_path)
+            return
+
+        boton_ejecutar.config(state="normal")
+        boton_cancelar.config(state="disabled")
+        estado.set("")
+        if mensaje[0] == 'fin':
+            errores, resumen = mensaje[1], mensaje[2]
             messagebox.showinfo("Proceso completado",
                                 f"Se ha generado el calculador de tramos del archivo {os.path.basename(gpx_path)}.\n"
-                                f"Lo puedes encontrar en el archivo {os.path.basename(xlsx_path)}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Ocurrió un error durante la ejecución:\n{e}")
+                                f"Lo puedes encontrar en el archivo {os.path.basename(xlsx_path)}\n\n"
+                                f"{resumen}")
+            if errores:
+                messagebox.showwarning("Archivos con errores",
+                                       "No se han podido procesar estos archivos:\n" +
+                                       "\n".join(f"{nombre}: {error}" for nombre, error in errores))
+        elif mensaje[0] == 'cancelado':
+            messagebox.showinfo("Proceso cancelado", "Se ha cancelado el cálculo de tramos.")
+        else:
+            messagebox.showerror("Error", f"Ocurrió un error durante la ejecución:\n{mensaje[1]}")
+
+    def pedir_cancelacion():
+        # El hilo se para al empezar la siguiente etapa o archivo
+        cancelar.set()
+        boton_cancelar.config(state="disabled")
+        estado.set("Cancelando...")
+
+    cola = queue.Queue()
+    cancelar = threading.Event()
 
     # --- Barra inferior: licencia | Ejecutar | ? --------------------------
     button_frame = tk.Frame(root)
@@ -490,7 +1808,7 @@ def crear_gui():
     tk.Label(firma_frame, text="Licencia GPL v3").grid(row=1, column=0, sticky="w")
 
     # --- Columna 1: botón Ejecutar (centro exacto) ------------------------
-    tk.Button(
+    boton_ejecutar = tk.Button(
         button_frame,
         text="Ejecutar",
         bg="green",
@@ -502,7 +1820,8 @@ def crear_gui():
             combo_seccion.get(),
             combo_preparacion.get()
         )
-    ).grid(row=0, column=1, padx=10)
+    )
+    boton_ejecutar.grid(row=0, column=1, padx=10)
 
     # --- Columna 2: botón de ayuda ? (alineado a la derecha) --------------
     tk.Button(
@@ -513,6 +1832,16 @@ def crear_gui():
     ).grid(row=0, column=2, sticky="e")
     # ---------------------------------------------------------------------
 
+    # --- Progreso del trabajo en curso | Cancelar ---------------------------
+    progreso_frame = tk.Frame(root)
+    progreso_frame.grid(row=4, column=0, padx=10, pady=(0, 10), sticky="new")
+    progreso_frame.columnconfigure(0, weight=1)
+
+    estado = tk.StringVar()
+    tk.Label(progreso_frame, textvariable=estado, anchor="w").grid(row=0, column=0, sticky="ew")
+    boton_cancelar = tk.Button(progreso_frame, text="Cancelar", state="disabled", command=pedir_cancelacion)
+    boton_cancelar.grid(row=0, column=1, padx=(5, 0))
+
 
 
     root.mainloop()
@@ -520,4 +1849,10 @@ def crear_gui():
 
 
 if __name__ == "__main__":
+    # Necesario para que los procesos del análisis en paralelo arranquen en el ejecutable de PyInstaller
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1:
+        # Con argumentos, el ejecutable funciona como línea de comandos (ver cli.py)
+        import cli
+        sys.exit(cli.ejecutar(sys.argv[1:]))
     crear_gui()
\ No newline at end of file
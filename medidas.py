@@ -0,0 +1,157 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Medidas por etapa de un análisis: tiempo, tramos de entrada y salida y, opcionalmente,
+# pico de memoria. Uso:
+#   medidas = Medidas()
+#   main(..., medidas=medidas)
+#   medidas.informe()   # diccionario con todas las etapas
+#   medidas.resumen()   # una línea para mostrar al usuario
+# Sin medidas (medidas=None), etapa() devuelve un contexto vacío compartido y no se mide nada.
+# aviso: función que recibe un texto al empezar cada etapa y cada archivo (progreso en la interfaz).
+# Si lanza Cancelado, el análisis se para en ese punto.
+
+import time
+import tracemalloc
+
+
+class _Etapa:
+    __slots__ = ('medidas', 'nombre', 'entrada', 'salida', 'detalle', '_inicio', '_base', '_traza_propia')
+
+    def __init__(self, medidas, nombre, entrada):
+        self.medidas = medidas
+        self.nombre = nombre
+        self.entrada = entrada
+        self.salida = None
+        self.detalle = None
+
+    def __enter__(self):
+        if self.medidas.aviso is not None:
+            archivo = self.medidas.archivo
+            self.medidas.avisar(self.nombre if archivo is None else f"{archivo}: {self.nombre}")
+        if self.medidas.memoria:
+            self._traza_propia = not tracemalloc.is_tracing()
+            if self._traza_propia:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._base = tracemalloc.get_traced_memory()[0]
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        segundos = time.perf_counter() - self._inicio
+        pico = None
+        if self.medidas.memoria:
+            pico = max(tracemalloc.get_traced_memory()[1] - self._base, 0)
+            if self._traza_propia:
+                tracemalloc.stop()
+
+        registro = {'etapa': self.nombre, 'segundos': round(segundos, 6),
+                    'entrada': self.entrada, 'salida': self.salida}
+        if self.medidas.archivo is not None:
+            registro['archivo'] = self.medidas.archivo
+        if self.detalle is not None:
+            registro['detalle'] = self.detalle
+        if pico is not None:
+            registro['pico_memoria_bytes'] = pico
+        if tipo is not None:
+            registro['error'] = tipo.__name__
+        self.medidas.etapas.append(registro)
+        return False
+
+
+class Cancelado(Exception):
+    # Lo lanza el aviso de progreso para cancelar el análisis en curso
+    pass
+
+
+class _SinMedir:
+    # Contexto vacío: admite las mismas asignaciones que _Etapa y no guarda nada
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        return False
+
+    def __setattr__(self, nombre, valor):
+        pass
+
+
+_SIN_MEDIR = _SinMedir()
+
+
+def etapa(medidas, nombre, entrada=None):
+    if medidas is None:
+        return _SIN_MEDIR
+    return _Etapa(medidas, nombre, entrada)
+
+
+class Medidas:
+    def __init__(self, memoria=False, aviso=None):
+        # memoria: medir el pico de memoria de cada etapa con tracemalloc (hace el análisis más lento)
+        # aviso: función llamada con un texto de progreso; no se pasa a otros procesos
+        self.memoria = memoria
+        self.aviso = aviso
+        self.etapas = []
+        self.archivo = None
+        self._inicio = time.perf_counter()
+
+    def avisar(self, texto):
+        if self.aviso is not None:
+            self.aviso(texto)
+
+    def anadir(self, etapas, archivo=None):
+        # Añade las etapas medidas en otro proceso
+        for registro in etapas:
+            if archivo is not None:
+                registro = {**registro, 'archivo': archivo}
+            self.etapas.append(registro)
+
+    def totales(self):
+        # Segundos por etapa, sumando todos los archivos
+        totales = {}
+        for registro in self.etapas:
+            totales[registro['etapa']] = totales.get(registro['etapa'], 0.0) + registro['segundos']
+        return totales
+
+    def informe(self):
+        informe = {
+            'total_segundos': round(time.perf_counter() - self._inicio, 6),
+            'archivos': len({r['archivo'] for r in self.etapas if 'archivo' in r}),
+            'totales': {nombre: round(segundos, 6) for nombre, segundos in self.totales().items()},
+            'etapas': self.etapas,
+        }
+        if self.memoria:
+            informe['pico_memoria_bytes'] = max((r.get('pico_memoria_bytes', 0) for r in self.etapas), default=0)
+        return informe
+
+    def resumen(self):
+        informe = self.informe()
+        lentas = sorted(informe['totales'].items(), key=lambda t: t[1], reverse=True)[:3]
+        texto = f"Tiempo total: {informe['total_segundos']:.2f} s"
+        if lentas:
+            texto += " (" + ", ".join(f"{nombre} {segundos:.2f} s" for nombre, segundos in lentas) + ")"
+        if informe['archivos'] > 1:
+            texto += f", {informe['archivos']} archivos"
+        if self.memoria:
+            texto += f", pico de memoria {informe['pico_memoria_bytes'] / 2**20:.1f} MB"
+        return texto
@@ -0,0 +1,103 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Puntos de una ruta en un archivo binario por columnas (.gxb), para no volver a leer el XML del GPX:
+#   cabecera: b'GXP1', 4 bytes de relleno y el número de puntos n (uint64)
+#   latitudes[n], longitudes[n], elevaciones[n], distancia_acumulada[n] (float64, en metros)
+# Solo se guardan los puntos que usa el análisis (los de leer_puntos_gpx). El archivo se abre con
+# mmap y las columnas son vistas sobre él: abrirlo no copia los datos ni ocupa memoria extra.
+
+import mmap
+import os
+import struct
+
+from escritura_atomica import escribir_atomico
+
+EXTENSION = '.gxb'
+
+_CABECERA = struct.Struct('<4s4xQ')  # 16 bytes, para que las columnas queden alineadas
+_MAGIC = b'GXP1'
+_COLUMNAS = ('latitudes', 'longitudes', 'elevaciones', 'distancia_acumulada')
+
+
+def es_puntos_binarios(ruta):
+    # str y no os.fspath: la ruta puede ser un miembro de un zip (entradas.MiembroZip)
+    return str(ruta).lower().endswith(EXTENSION)
+
+
+def guardar_puntos(ruta, latitudes, longitudes, elevaciones, distancia_acumulada):
+    # Admite array('d') o arrays de numpy. Escritura atómica, como la caché
+    with escribir_atomico(ruta) as f:
+        f.write(_CABECERA.pack(_MAGIC, len(latitudes)))
+        for columna in (latitudes, longitudes, elevaciones, distancia_acumulada):
+            f.write(memoryview(columna).cast('B'))
+
+
+class PuntosBinarios:
+    # Uso:
+    #   with PuntosBinarios('ruta.gxb') as puntos:
+    #       for lat, lon, ele in puntos: ...
+    #       puntos.elevaciones[i], puntos.distancia_acumulada[-1]
+    # Las columnas son memoryview de float64; columnas_np() las da como arrays de numpy, sin copiar.
+
+    def __init__(self, ruta):
+        with open(ruta, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _CABECERA.size:
+            self._mmap.close()
+            raise ValueError(f"'{os.fspath(ruta)}' no es un archivo de puntos válido")
+        magic, self.n = _CABECERA.unpack_from(self._mmap)
+        if magic != _MAGIC or len(self._mmap) != _CABECERA.size + 32 * self.n:
+            self._mmap.close()
+            raise ValueError(f"'{os.fspath(ruta)}' no es un archivo de puntos válido")
+
+        vista = memoryview(self._mmap)
+        self._vistas = [vista]
+        for i, nombre in enumerate(_COLUMNAS):
+            inicio = _CABECERA.size + 8 * self.n * i
+            columna = vista[inicio:inicio + 8 * self.n].cast('d')
+            self._vistas.append(columna)
+            setattr(self, nombre, columna)
+
+    def columnas_np(self, np):
+        # (latitudes, longitudes, elevaciones, distancia_acumulada) como arrays de numpy sobre el mismo mmap
+        return tuple(np.frombuffer(self._mmap, dtype=np.float64, count=self.n, offset=_CABECERA.size + 8 * self.n * i)
+                     for i in range(len(_COLUMNAS)))
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return zip(self.latitudes, self.longitudes, self.elevaciones)
+
+    def cerrar(self):
+        for vista in reversed(self._vistas):
+            vista.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # Aún hay arrays de numpy sobre el mmap: se cierra cuando dejen de usarse
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.cerrar()
+        return False
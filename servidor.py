@@ -0,0 +1,343 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Servicio HTTP local para generar calculadores desde el navegador, sin arrancar el programa en cada
+# petición. La plantilla se lee una sola vez y el análisis va a un grupo fijo de procesos. Uso:
+#   python servidor.py --puerto 8765 --procesos 4
+# Peticiones (el GPX en el cuerpo, o uno o varios archivos en un formulario multipart/form-data):
+#   POST /tramos?archivo=ruta.gpx        -> JSON con los tramos, igual que cli.py --formato json
+#   POST /calculador?seccion=Scout&...   -> el calculador (.xlsx), una hoja por ruta
+#   GET  /salud                          -> estado del servicio
+# Valores: los de main (umbral_elevacion, ..., seccion, preparacion, descanso, cada) y motor/decimar,
+# en la URL o como campos del formulario. Se admiten .gpx, .gpx.gz, .gpx.bz2, .gpx.xz y .zip (entradas.py).
+# Solo atiende a la vez max_peticiones peticiones (al resto responde 503) y rechaza con 413 los cuerpos
+# de más de tamano_maximo bytes; un zip o un GPX comprimido tampoco puede pasar de ahí descomprimido.
+# Solo usa la biblioteca estándar: se puede probar contra localhost.
+
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import functools
+import io
+import json
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qsl, quote, urlsplit
+
+import entradas
+import escritor_xlsx
+import main as programa
+from cli import PREPARACIONES, SECCIONES, escribir_json
+
+TIPO_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+MAX_CABECERAS = 100
+SEGUNDOS_LECTURA = 30
+SEGUNDOS_CIERRE = 2
+
+
+class ErrorHttp(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def _valores(campos):
+    # Los valores de la petición, con los mismos valores por defecto que cli.py
+    try:
+        parametros = tuple(type(programa.VALORES_POR_DEFECTO[nombre])(campos.get(nombre, programa.VALORES_POR_DEFECTO[nombre]))
+                           for nombre in programa.PARAMETROS)
+        descanso = int(campos.get('descanso', 10))
+        cada = max(int(campos.get('cada', 60)), 1)
+        decimar = float(campos.get('decimar', 0))
+    except ValueError as e:
+        raise ErrorHttp(400, f"Valor no válido: {e}")
+    seccion = campos.get('seccion', "Scout")
+    preparacion = campos.get('preparacion', "Media")
+    motor = campos.get('motor', 'python')
+    if seccion not in SECCIONES:
+        raise ErrorHttp(400, f"Sección desconocida '{seccion}'. Opciones: {', '.join(SECCIONES)}")
+    if preparacion not in PREPARACIONES:
+        raise ErrorHttp(400, f"Preparación desconocida '{preparacion}'. Opciones: {', '.join(PREPARACIONES)}")
+    if motor not in programa.MOTORES:
+        raise ErrorHttp(400, f"Motor desconocido '{motor}'. Opciones: {', '.join(programa.MOTORES)}")
+    return parametros, (seccion, preparacion, descanso, cada), motor, decimar
+
+
+def _formulario(tipo, cuerpo):
+    # Los campos y los (nombre, contenido) de los archivos de un cuerpo multipart/form-data
+    mensaje = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {tipo}\r\n\r\n".encode('latin-1') + cuerpo)
+    if not mensaje.is_multipart():
+        raise ErrorHttp(400, "Formulario multipart/form-data no válido")
+    campos, archivos = {}, []
+    for parte in mensaje.iter_parts():
+        nombre = parte.get_param('name', header='content-disposition')
+        contenido = parte.get_payload(decode=True) or b''
+        if parte.get_filename():
+            archivos.append((parte.get_filename(), contenido))
+        elif nombre:
+            campos[nombre] = contenido.decode('utf-8', 'replace')
+    return campos, archivos
+
+
+def _rutas(archivos, tamano_maximo):
+    # Las rutas de los archivos recibidos: un zip se abre en memoria y da una ruta por cada GPX.
+    # Devuelve las rutas y los (archivo, error) de los que no se pueden usar
+    rutas, errores = [], []
+    for nombre, datos in archivos:
+        nombre = nombre.replace('\\', '/').rpartition('/')[2] or 'ruta.gpx'
+        if entradas.es_zip(nombre):
+            try:
+                with zipfile.ZipFile(io.BytesIO(datos)) as archivo:
+                    miembros = [info for info in archivo.infolist() if not info.is_dir()
+                                and info.filename.lower().endswith('.gpx')
+                                and not info.filename.rpartition('/')[2].startswith('.')]
+                    # Lo que ocupa descomprimido también cuenta para el límite
+                    if sum(info.file_size for info in miembros) > tamano_maximo:
+                        errores.append((nombre, "El zip descomprimido supera el tamaño máximo"))
+                        continue
+                    rutas.extend(entradas.RutaEnMemoria(f"{nombre}/{info.filename}", archivo.read(info))
+                                 for info in miembros)
+            except zipfile.BadZipFile:
+                errores.append((nombre, f"'{nombre}' no es un archivo zip válido"))
+        elif entradas.es_gpx(nombre):
+            # Un .gpx.gz/.bz2/.xz se descomprime al analizarlo, con el mismo límite que un zip
+            rutas.append(entradas.RutaEnMemoria(nombre, datos, tamano_maximo))
+        else:
+            errores.append((nombre, "Extensión no admitida: se esperaba .gpx, .gpx.gz, .gpx.bz2, .gpx.xz o .zip"))
+    return rutas, errores
+
+
+def _respuesta(estado, cuerpo=b'', tipo='application/json; charset=utf-8', cabeceras=()):
+    estado = HTTPStatus(estado)
+    lineas = [f"HTTP/1.1 {estado.value} {estado.phrase}", f"Content-Type: {tipo}",
+              f"Content-Length: {len(cuerpo)}", "Connection: close", *cabeceras]
+    return ("\r\n".join(lineas) + "\r\n\r\n").encode('latin-1') + cuerpo
+
+
+def _json(estado, datos, cabeceras=()):
+    return _respuesta(estado, json.dumps(datos, ensure_ascii=False).encode('utf-8'), cabeceras=cabeceras)
+
+
+class Servidor:
+    def __init__(self, host='127.0.0.1', puerto=8765, procesos=None, max_peticiones=4,
+                 tamano_maximo=32 * 1024 * 1024):
+        # procesos: tamaño del grupo de procesos de análisis (None = todos los núcleos)
+        # max_peticiones: peticiones atendidas a la vez; tamano_maximo: bytes por petición
+        self.host = host
+        self.puerto = puerto
+        self.procesos = procesos or os.cpu_count() or 1
+        self.max_peticiones = max_peticiones
+        self.tamano_maximo = tamano_maximo
+        self.en_curso = 0
+        self._plantilla = None
+        self._grupo = None
+        self._servidor = None
+
+    async def iniciar(self):
+        # Deja la plantilla leída y los procesos arrancados antes de aceptar la primera petición
+        loop = asyncio.get_running_loop()
+        self._plantilla = escritor_xlsx.leer_plantilla(programa.resource_path('plantilla.xlsx'))
+        self._grupo = ProcessPoolExecutor(max_workers=self.procesos)
+        await asyncio.gather(*(loop.run_in_executor(self._grupo, int) for _ in range(self.procesos)))
+        self._servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+        self.puerto = self._servidor.sockets[0].getsockname()[1]
+        return self
+
+    async def servir(self):
+        async with self._servidor:
+            await self._servidor.serve_forever()
+
+    async def cerrar(self):
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+        if self._grupo is not None:
+            self._grupo.shutdown(wait=False, cancel_futures=True)
+
+    async def _atender(self, reader, writer):
+        try:
+            if self.en_curso >= self.max_peticiones:
+                await self._enviar(reader, writer, _json(503, {'error': "Servicio ocupado, inténtelo de nuevo"},
+                                                         ["Retry-After: 1"]))
+                return
+            self.en_curso += 1
+            try:
+                respuesta = await self._responder(reader, writer)
+            except ErrorHttp as e:
+                respuesta = _json(e.estado, {'error': str(e)})
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                return
+            except Exception as e:
+                respuesta = _json(500, {'error': str(e) or type(e).__name__})
+            finally:
+                self.en_curso -= 1
+            await self._enviar(reader, writer, respuesta)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _enviar(self, reader, writer, respuesta):
+        writer.write(respuesta)
+        await writer.drain()
+        # Si se responde sin haber leído todo el cuerpo (413, 503...), cerrar de golpe haría que el
+        # cliente recibiese un error de conexión en lugar de la respuesta: se descarta lo que quede
+        if writer.can_write_eof():
+            writer.write_eof()
+        try:
+            await asyncio.wait_for(self._descartar(reader), SEGUNDOS_CIERRE)
+        except asyncio.TimeoutError:
+            pass
+
+    @staticmethod
+    async def _descartar(reader):
+        while await reader.read(1 << 16):
+            pass
+
+    async def _leer_cabeceras(self, reader):
+        try:
+            linea = await reader.readline()
+            metodo, destino, _ = linea.decode('latin-1').split()
+        except ValueError:
+            raise ErrorHttp(400, "Petición no válida")
+        cabeceras = {}
+        for _ in range(MAX_CABECERAS):
+            try:
+                linea = await reader.readline()
+            except ValueError:
+                raise ErrorHttp(431, "Cabecera demasiado larga")
+            if linea in (b'\r\n', b'\n', b''):
+                return metodo, destino, cabeceras
+            nombre, _, valor = linea.decode('latin-1').partition(':')
+            cabeceras[nombre.strip().lower()] = valor.strip()
+        raise ErrorHttp(431, "Demasiadas cabeceras")
+
+    async def _responder(self, reader, writer):
+        metodo, destino, cabeceras = await asyncio.wait_for(self._leer_cabeceras(reader), SEGUNDOS_LECTURA)
+        url = urlsplit(destino)
+        if url.path == '/salud':
+            if metodo != 'GET':
+                raise ErrorHttp(405, "Método no permitido")
+            return _json(200, {'estado': 'ok', 'procesos': self.procesos,
+                               'en_curso': self.en_curso, 'max_peticiones': self.max_peticiones})
+        if url.path not in ('/tramos', '/calculador'):
+            raise ErrorHttp(404, "No existe")
+        if metodo != 'POST':
+            raise ErrorHttp(405, "Método no permitido")
+
+        if 'transfer-encoding' in cabeceras or 'content-length' not in cabeceras:
+            raise ErrorHttp(411, "Falta Content-Length")
+        try:
+            longitud = int(cabeceras['content-length'])
+        except ValueError:
+            raise ErrorHttp(400, "Content-Length no válido")
+        if longitud < 0:
+            raise ErrorHttp(400, "Content-Length no válido")
+        if longitud > self.tamano_maximo:
+            raise ErrorHttp(413, f"La petición supera el tamaño máximo ({self.tamano_maximo} bytes)")
+        if cabeceras.get('expect', '').lower() == '100-continue':
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+        cuerpo = await asyncio.wait_for(reader.readexactly(longitud), SEGUNDOS_LECTURA)
+
+        campos = dict(parse_qsl(url.query))
+        tipo = cabeceras.get('content-type', '')
+        if tipo.lower().startswith('multipart/form-data'):
+            campos_formulario, archivos = _formulario(tipo, cuerpo)
+            campos.update(campos_formulario)
+        else:
+            archivos = [(campos.get('archivo', 'ruta.gpx'), cuerpo)]
+        parametros, calculador, motor, decimar = _valores(campos)
+
+        rutas, errores = _rutas(archivos, self.tamano_maximo)
+        hojas, errores_analisis = await self._analizar(rutas, parametros, motor, decimar)
+        errores += errores_analisis
+        if not hojas:
+            raise ErrorHttp(422, "No se ha podido procesar ningún archivo GPX:\n" +
+                            "\n".join(f"{nombre}: {error}" for nombre, error in errores))
+
+        if url.path == '/tramos':
+            salida = io.StringIO()
+            escribir_json(hojas, errores, salida)
+            return _respuesta(200, salida.getvalue().encode('utf-8'))
+
+        salida = io.BytesIO()
+        await asyncio.to_thread(escritor_xlsx.generar_calculador, self._plantilla, salida, hojas, *calculador)
+        nombre = "CalculadorDeTramos" if len(hojas) > 1 else hojas[0][0]
+        cabeceras = [f"Content-Disposition: attachment; filename*=UTF-8''{quote(nombre)}.xlsx"]
+        if errores:
+            cabeceras.append(f"X-Errores: {len(errores)}")
+        return _respuesta(200, salida.getvalue(), TIPO_XLSX, cabeceras)
+
+    async def _analizar(self, rutas, parametros, motor, decimar):
+        # Cada ruta en un proceso del grupo. Devuelve los (nombre de hoja, tramos) y los (archivo, error)
+        loop = asyncio.get_running_loop()
+        resultados = await asyncio.gather(*(
+            loop.run_in_executor(self._grupo, functools.partial(programa.get_tramos_finales, ruta, *parametros,
+                                                                motor=motor, decimar=decimar))
+            for ruta in rutas), return_exceptions=True)
+        hojas, errores = [], []
+        for ruta, resultado in zip(rutas, resultados):
+            if isinstance(resultado, Exception):
+                errores.append((ruta.name, str(resultado) or type(resultado).__name__))
+            else:
+                hojas.append((programa.nombre_de_hoja(ruta), resultado))
+        return hojas, errores
+
+
+async def _servir(servidor):
+    await servidor.iniciar()
+    print(f"Escuchando en http://{servidor.host}:{servidor.puerto} (Ctrl+C para terminar)", file=sys.stderr, flush=True)
+    try:
+        await servidor.servir()
+    finally:
+        await servidor.cerrar()
+
+
+def ejecutar(argv=None):
+    parser = argparse.ArgumentParser(prog='AutoCalculadorDeTramos-servidor',
+                                     description="Servicio HTTP local que genera calculadores de tramos.")
+    parser.add_argument('--host', default='127.0.0.1', help="(por defecto: %(default)s)")
+    parser.add_argument('--puerto', type=int, default=8765, help="0 = cualquiera libre (por defecto: %(default)s)")
+    parser.add_argument('--procesos', type=int, default=0,
+                        help="procesos de análisis, 0 = todos los núcleos (por defecto: %(default)s)")
+    parser.add_argument('--max-peticiones', type=int, default=4,
+                        help="peticiones atendidas a la vez (por defecto: %(default)s)")
+    parser.add_argument('--tamano-maximo', type=float, default=32, metavar='MB',
+                        help="tamaño máximo de cada petición, en MB (por defecto: %(default)s)")
+    args = parser.parse_args(argv)
+
+    servidor = Servidor(args.host, args.puerto, args.procesos or None, max(args.max_peticiones, 1),
+                        int(args.tamano_maximo * 1024 * 1024))
+    try:
+        asyncio.run(_servir(servidor))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    programa.multiprocessing.freeze_support()
+    sys.exit(ejecutar())
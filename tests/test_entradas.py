@@ -0,0 +1,44 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Un GPX comprimido en memoria no puede pasar de su límite al descomprimirse
+
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+import entradas
+
+DATOS = b'<gpx>' + b' ' * 100000 + b'</gpx>'
+
+
+@pytest.mark.parametrize('sufijo, comprimir', [('.gz', gzip.compress), ('.bz2', bz2.compress), ('.xz', lzma.compress)])
+def test_limite_al_descomprimir(sufijo, comprimir):
+    ruta = entradas.RutaEnMemoria(f'ruta.gpx{sufijo}', comprimir(DATOS), limite=len(DATOS))
+    with entradas.abrir(ruta) as archivo:
+        assert archivo.read() == DATOS
+
+    ruta = entradas.RutaEnMemoria(f'ruta.gpx{sufijo}', comprimir(DATOS), limite=len(DATOS) - 1)
+    with pytest.raises(ValueError, match='supera el tamaño máximo'):
+        with entradas.abrir(ruta) as archivo:
+            while archivo.read(4096):
+                pass
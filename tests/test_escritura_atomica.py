@@ -0,0 +1,47 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+import json
+import os
+
+import pytest
+
+from escritura_atomica import escribir_atomico
+
+
+def test_sustituye_al_terminar(tmp_path):
+    ruta = tmp_path / 'datos.json'
+    ruta.write_text('viejo', encoding='utf-8')
+    with escribir_atomico(ruta, 'w', encoding='utf-8') as f:
+        json.dump({'a': 1}, f)
+        assert ruta.read_text(encoding='utf-8') == 'viejo'
+    assert json.loads(ruta.read_text(encoding='utf-8')) == {'a': 1}
+    assert os.listdir(tmp_path) == ['datos.json']
+
+
+def test_no_deja_el_temporal_si_falla(tmp_path):
+    ruta = tmp_path / 'datos.bin'
+    ruta.write_bytes(b'viejo')
+    with pytest.raises(RuntimeError):
+        with escribir_atomico(ruta) as f:
+            f.write(b'a medias')
+            raise RuntimeError
+    assert ruta.read_bytes() == b'viejo'
+    assert os.listdir(tmp_path) == ['datos.bin']
@@ -0,0 +1,81 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Los tramos de una ventana del IndiceRuta son los mismos que al analizar solo esos puntos
+
+import random
+
+import main as programa
+
+PARAMETROS = tuple(programa.VALORES_POR_DEFECTO[nombre] for nombre in programa.PARAMETROS)
+
+
+def _puntos(n=3000, semilla=7):
+    # Rachas largas de subida y bajada con decimales arbitrarios, para que el orden de las sumas importe
+    azar = random.Random(semilla)
+    lat, lon, ele = 40.4, -3.7, 900.0
+    puntos = []
+    direccion = 1
+    for i in range(n):
+        if i % 180 == 0:
+            direccion = -direccion
+        lat += azar.uniform(0.00005, 0.0002)
+        lon += azar.uniform(-0.0001, 0.0001)
+        ele += direccion * azar.uniform(0.01, 1.3) + azar.uniform(-0.2, 0.2)
+        puntos.append((lat, lon, ele))
+    return puntos
+
+
+def _escribir_gpx(ruta, puntos):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>\n')
+        for lat, lon, ele in puntos:
+            f.write(f'<trkpt lat="{lat!r}" lon="{lon!r}"><ele>{ele!r}</ele></trkpt>\n')
+        f.write('</trkseg></trk></gpx>\n')
+
+
+def _km_del_punto(indice, i):
+    # Un kilómetro entre los puntos i - 1 e i, para que _punto devuelva i sin depender del redondeo
+    if i == 0:
+        return 0.0
+    return (indice.distancia_acumulada[i - 1] + indice.distancia_acumulada[i]) / 2000
+
+
+def test_ventanas_igual_que_analizar_los_puntos(tmp_path):
+    puntos = _puntos()
+    ruta = tmp_path / 'ruta.gpx'
+    _escribir_gpx(ruta, puntos)
+    indice = programa.indexar_ruta(ruta)
+
+    # Cortes dentro de rachas, en el borde de una racha y en los extremos
+    ventanas = [(0, 2999), (37, 1501), (90, 455), (180, 1080), (1234, 2999), (2500, 2620)]
+    for i, j in ventanas:
+        tramo = tmp_path / f'tramo_{i}_{j}.gpx'
+        _escribir_gpx(tramo, puntos[i:j + 1])
+
+        distancias, elevaciones = programa.columnas_de_segmentos(tramo)
+        assert (distancias, elevaciones) == (indice.distancias[i:j], indice.elevaciones[i:j])
+        por_direccion = programa.agrupar_por_direccion(programa._tramos_de_columnas(distancias, elevaciones))
+        esperado = ([t.distancia_m for t in por_direccion], [t.elevacion_m for t in por_direccion])
+        assert tuple(map(list, indice._por_direccion(i, j))) == esperado, (i, j)
+
+        tramos = indice.tramos(_km_del_punto(indice, i), _km_del_punto(indice, j), *PARAMETROS)
+        assert tramos == programa.get_tramos_finales(tramo, *PARAMETROS), (i, j)
@@ -0,0 +1,81 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Los motores python, numpy y stream dan los mismos tramos, con los mismos cortes y las mismas sumas
+
+import random
+
+import pytest
+
+import main as programa
+
+PARAMETROS = tuple(programa.VALORES_POR_DEFECTO[nombre] for nombre in programa.PARAMETROS)
+
+
+def _puntos_variados(n=2500, semilla=3):
+    # Subidas, bajadas, llanos y algún punto repetido, con decimales arbitrarios
+    azar = random.Random(semilla)
+    lat, lon, ele = 42.8, -1.6, 450.0
+    puntos = []
+    for i in range(n):
+        if i % 97 != 13:
+            lat += azar.uniform(0.00003, 0.00025)
+            lon += azar.uniform(-0.00012, 0.00012)
+        ele += azar.choice((1, -1, 0.2)) * azar.uniform(0.0, 2.5)
+        puntos.append((lat, lon, ele))
+    return puntos
+
+
+def _puntos_un_tramo():
+    # Una subida corta y constante: queda un solo tramo
+    return [(40.0 + 0.0002 * i, -3.7, 600.0 + 1.5 * i) for i in range(20)]
+
+
+def _escribir_gpx(ruta, puntos):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>\n')
+        for lat, lon, ele in puntos:
+            f.write(f'<trkpt lat="{lat!r}" lon="{lon!r}"><ele>{ele!r}</ele></trkpt>\n')
+        f.write('</trkseg></trk></gpx>\n')
+
+
+@pytest.mark.parametrize('motor', ['numpy', 'stream'])
+@pytest.mark.parametrize('puntos, decimar', [
+    (_puntos_variados(), 0),
+    (_puntos_variados(), 1.5),
+    (_puntos_un_tramo(), 0),
+])
+def test_mismos_tramos_que_python(tmp_path, motor, puntos, decimar):
+    if motor == 'numpy':
+        pytest.importorskip('numpy')
+    ruta = tmp_path / 'ruta.gpx'
+    _escribir_gpx(ruta, puntos)
+    esperado = programa.get_tramos_finales(ruta, *PARAMETROS, motor='python', decimar=decimar)
+    assert esperado
+    assert programa.get_tramos_finales(ruta, *PARAMETROS, motor=motor, decimar=decimar) == esperado
+
+
+def test_un_solo_tramo(tmp_path):
+    ruta = tmp_path / 'ruta.gpx'
+    _escribir_gpx(ruta, _puntos_un_tramo())
+    tramos = programa.get_tramos_finales(ruta, *PARAMETROS)
+    assert len(tramos) == 1
+    assert tramos[0]['tramo'] == 1
@@ -0,0 +1,77 @@
+"""
+ * AutoCalculadorDeTramos
+ * Copyright © 2023-2025  Marcos Martín Sandeogracias
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+/* SPDX-License-Identifier: GPL-3.0 https://www.gnu.org/licenses/licenses/license-object.html*/
+"""
+
+# Las funciones públicas de agrupación siguen aceptando los diccionarios de siempre
+
+import main as programa
+from main import Tramo
+
+SEGMENTOS = [(10.0, 1.0), (12.0, 2.5), (8.0, -0.5), (30.0, -4.0), (5.0, 0.2), (40.0, 6.0), (7.0, -1.0), (20.0, 3.0)]
+
+
+def _diccionarios():
+    return [{'distancia_m': d, 'elevacion_m': e} for d, e in SEGMENTOS]
+
+
+def _tramos():
+    return [Tramo(d, e) for d, e in SEGMENTOS]
+
+
+def test_agrupar_con_diccionarios():
+    casos = [
+        (programa.agrupar_por_direccion, ()),
+        (programa.agrupar_por_umbral, (2,)),
+        (programa.agrupar_por_umbral2, (0.6, 15, 20, 3)),
+        (programa.decimar_perfil, (1.0,)),
+    ]
+    for funcion, argumentos in casos:
+        esperado = funcion(_tramos(), *argumentos)
+        assert funcion(_diccionarios(), *argumentos) == esperado, funcion.__name__
+
+
+def test_agrupar_no_modifica_los_diccionarios():
+    tramos = _diccionarios()
+    programa.agrupar_por_direccion(tramos)
+    assert tramos == _diccionarios()
+
+
+def test_primer_tramo_con_diccionarios():
+    esperado = list(programa.etapa_primer_tramo(_tramos(), 2, 15))
+    assert list(programa.etapa_primer_tramo(_diccionarios(), 2, 15)) == esperado
+
+
+def test_enumerar_diccionarios_en_su_sitio():
+    tramos = programa.agrupar_por_direccion(_tramos())
+    diccionarios = [dict(tramo) for tramo in tramos]
+    objetos = list(diccionarios)
+
+    resultado = programa.calcular_pendiente_y_enumerar(diccionarios)
+    assert resultado is diccionarios
+    assert all(a is b for a, b in zip(resultado, objetos))
+    assert all(type(tramo) is dict for tramo in resultado)
+    assert resultado == programa.calcular_pendiente_y_enumerar(tramos)
+    assert [tramo['tramo'] for tramo in resultado] == list(range(1, len(resultado) + 1))
+
+
+def test_etapa_enumerar_diccionarios():
+    diccionarios = [dict(tramo) for tramo in programa.agrupar_por_direccion(_diccionarios())]
+    enumerados = list(programa.etapa_enumerar(diccionarios))
+    assert all(a is b for a, b in zip(enumerados, diccionarios))
+    assert 'pendiente_%' in diccionarios[0]